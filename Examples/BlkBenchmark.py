@@ -0,0 +1,30 @@
+import os
+import time
+
+from WtFileUtils.blk.BlkParser import BlkDecoder
+from WtFileUtils.blk.BlockConverter import DuplicatePolicy
+
+'''
+times the blk decoder on the test files, cmngetbin.blk is a big server blk (~56k params, ~19k blocks)
+'''
+TEST_FILE = os.path.join(os.path.dirname(__file__), "..", "tests", "testFiles", "cmngetbin.blk")
+
+
+def best_of(func, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        took = time.perf_counter() - start
+        if best is None or took < best:
+            best = took
+    return best
+
+
+if __name__ == '__main__':
+    with open(TEST_FILE, "rb") as f:
+        raw = f.read()
+    decoder = BlkDecoder(raw)
+    print(f"decode: {best_of(lambda: BlkDecoder(raw)):.4f}s")
+    for policy in DuplicatePolicy.policies:
+        print(f"to_dict({policy}): {best_of(lambda: decoder.to_dict(policy)):.4f}s")
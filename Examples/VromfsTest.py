@@ -5,11 +5,13 @@ import os
 import re
 
 
-def dump_all(wt_install_path, dump_path, silent=False):
+def dump_all(wt_install_path, dump_path, silent=False, workers=None):
     """
     Dumps all the files from the binary folder (which is the most up to date VROMFS) to dump_path.
     AKA this emulates what most vromfs dumpers do
     MY BLK UNPACKER IS NOT THE FASTEST, SO THIS IS RATHER SLOW (can take a few minutes)
+    passing workers spreads the blk decoding of each VROMFs over that many processes (see VROMFs.decode_all), files
+    that exist in more than one VROMFs are then written by the last one instead of the first
     """
     files = os.listdir(wt_install_path + "/cache")
     input_path = None
@@ -20,6 +22,13 @@ def dump_all(wt_install_path, dump_path, silent=False):
     if input_path is None:
         print("unable to find binary path")
     raw_vromfs_files = os.listdir(input_path)
+    if workers is not None:
+        for file in raw_vromfs_files:
+            temp_path = os.path.join(input_path, file)
+            VROMFs(temp_path).decode_all(workers=workers, dump_path=dump_path)
+            print(f"Dumped {temp_path}")
+        print("completed")
+        return
     d = FSDirectory("Base", None)
     for file in raw_vromfs_files:
         temp_path = os.path.join(input_path, file)
@@ -1,6 +1,8 @@
 import io
-import copy
-import math
+import mmap
+import struct
+
+import numpy as np
 
 
 class DataHandler:
@@ -14,30 +16,38 @@ class DataHandler:
 
     most common use case is to pass a 'bytes' or 'bytearray' object
 
-    current usage inside the project is only as passing raw data and not using file io
+    files are memory mapped (read only) instead of read, so big files are never copied into process memory. in file mode
+    fetch / get_rest return zero copy memoryview slices of the mapping, and reading past the end raises EOFError.
+    the file object can be closed once the DataHandler is made, the mapping stays valid until close() is called
     """
 
     def __init__(self, data, offset: int, read_from_start: bool):
         self._data = data
-        self._ptr = offset  # only used when blob
+        self._ptr = offset
         self._isFile = False
-        if type(data) is io.BufferedReader:
+        self._mmap = None
+        if isinstance(data, (io.BufferedReader, io.FileIO)):
             self._isFile = True
-            if read_from_start:
-                data.seek(offset)
-            else:
-                data.read(offset)
-        else:
-            self.length = len(self._data)
+            if not read_from_start:
+                self._ptr = data.tell() + offset
+            size = data.seek(0, io.SEEK_END)
+            if size > 0:
+                self._mmap = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = memoryview(self._mmap)
+            else:  # empty files cant be mapped
+                self._data = memoryview(b"")
+        self.length = len(self._data)
 
+    def _check(self, count: int) -> None:
+        if self._isFile and (self._ptr + count > self.length or self._ptr + count < 0):
+            raise EOFError(f"tried to read {count} bytes at {self._ptr}, file is only {self.length} bytes")
 
     '''
     fetches (count) number of bytes from the data source
     '''
 
     def fetch(self, count: int) -> bytes:
-        if self._isFile:
-            return self._data.read(count)
+        self._check(count)
         self._ptr += count
         return self._data[self._ptr - count:self._ptr]
 
@@ -46,19 +56,23 @@ class DataHandler:
     '''
 
     def advance(self, count: int) -> None:
-        if self._isFile:
-            self._data.read(count)
-            return
+        self._check(count)
         self._ptr += count
         return
 
+    def seek(self, ptr: int) -> None:
+        """
+        moves the pointer to (ptr), counted from the start of the data
+        """
+        if self._isFile and not 0 <= ptr <= self.length:
+            raise EOFError(f"tried to seek to {ptr}, file is only {self.length} bytes")
+        self._ptr = ptr
+
     def get_rest(self):
-        if self._isFile:
-            return self._data.read()
         return self._data[self._ptr:]
 
     def get_ptr(self):
-        return copy.deepcopy(self._ptr)
+        return self._ptr
 
     '''
     function to get next four bytes from the data source and convert it to an int
@@ -84,10 +98,16 @@ class DataHandler:
         return value
 
     def is_EOF(self):
-        if not self._isFile:
-            return self._ptr == self.length
+        return self._ptr >= self.length
 
     def readString(self):
+        if self._mmap is not None:
+            end = self._mmap.find(b"\x00", self._ptr)
+            if end == -1:
+                raise EOFError(f"no string terminator after {self._ptr}")
+            payload = self._data[self._ptr:end].tobytes()
+            self._ptr = end + 1
+            return payload
         payload = b""
         c = self.fetch(1)
         while c != b"\x00":
@@ -95,34 +115,203 @@ class DataHandler:
             c = self.fetch(1)
         return payload
 
+    def close(self) -> None:
+        """
+        releases the file mapping, any memoryview handed out by fetch / get_rest must be released first
+        """
+        if self._mmap is not None:
+            self._data.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+class DataCursor:
+    """
+    a zero copy version of DataHandler for data that is already in memory (bytes, bytearray, mmap, memoryview)
+    has the same reading functions, but fetch returns memoryview slices of the original buffer instead of copies and
+    numbers are read with struct.unpack_from straight out of the buffer
+    data: the data to read
+    offset: where to start the pointer
+    """
+    _u32 = struct.Struct("<I")
+    _u64 = struct.Struct("<Q")
+
+    def __init__(self, data, offset: int = 0):
+        self._data = data
+        self._view = memoryview(data).cast("B") if not isinstance(data, memoryview) else data.cast("B")
+        self._ptr = offset
+        self.length = len(self._view)
+        # bytes, bytearray and mmap can search for the string terminator in C, memoryview cant. a memoryview slice of
+        # one of them searches the object under it instead, shifted by where the slice starts
+        self._find = getattr(data, "find", None)
+        self._base = 0
+        if self._find is None:
+            self._find, self._base = _backing_find(self._view)
+
+    def fetch(self, count: int) -> memoryview:
+        self._ptr += count
+        return self._view[self._ptr - count:self._ptr]
+
+    def advance(self, count: int) -> None:
+        self._ptr += count
+
+    def seek(self, ptr: int) -> None:
+        self._ptr = ptr
+
+    def get_rest(self) -> memoryview:
+        return self._view[self._ptr:]
+
+    def get_ptr(self) -> int:
+        return self._ptr
+
+    def get_int(self) -> int:
+        value = self._u32.unpack_from(self._view, self._ptr)[0]
+        self._ptr += 4
+        return value
+
+    def get_long(self) -> int:
+        value = self._u64.unpack_from(self._view, self._ptr)[0]
+        self._ptr += 8
+        return value
+
+    def decode_uleb128(self) -> int:
+        """Decodes a ULEB128 encoded value."""
+        view = self._view
+        byte = view[self._ptr]
+        self._ptr += 1
+        if byte < 0x80:  # most values fit in a single byte
+            return byte
+        value = byte & 0x7f
+        shift = 7
+        while True:
+            byte = view[self._ptr]
+            self._ptr += 1
+            value |= (byte & 0x7f) << shift
+            if not (byte & 0x80):
+                return value
+            shift += 7
+
+    def is_EOF(self) -> bool:
+        return self._ptr >= self.length
+
+    def readString(self) -> bytes:
+        """
+        reads a null terminated string and moves past the terminator, the terminator is not included
+        """
+        if self._find is not None:
+            end = self._find(b"\x00", self._base + self._ptr, self._base + self.length)
+            if end != -1:
+                end -= self._base
+        else:  # last resort, a buffer that cant be searched in C
+            end = self._ptr
+            while end < self.length and self._view[end] != 0:
+                end += 1
+            if end == self.length:
+                end = -1
+        if end == -1:
+            raise IndexError("readString ran past the end of the data")
+        payload = self._view[self._ptr:end].tobytes()
+        self._ptr = end + 1
+        return payload
+
+
+def _backing_find(view: memoryview):
+    """
+    the find of the object a memoryview is a slice of and where the slice starts in it, (None, 0) when there is none
+    """
+    obj = view.obj
+    find = getattr(obj, "find", None)
+    if find is None or not view.c_contiguous:
+        return None, 0
+    try:
+        base = np.frombuffer(view, dtype=np.uint8).ctypes.data - np.frombuffer(obj, dtype=np.uint8).ctypes.data
+    except (TypeError, ValueError):
+        return None, 0
+    if base < 0 or base + view.nbytes > len(obj):
+        return None, 0
+    return find, base
+
 
 class BitStream:
+    """
+    reads a stream of bits, most significant bit of each byte first
+    data: the bytes to read
+    bit_index: which bit to start at
+
+    reads are done by turning the bytes that cover the requested bits into one int and shifting / masking out the bits,
+    so unaligned reads cost about the same as aligned ones
+    """
     def __init__(self, data, bit_index=0):
         self.data = data
         self.current_bit_index = bit_index
 
+    def read_bits(self, bit_count) -> int:
+        """
+        reads (bit_count) bits and returns them as an int, the first bit read is the most significant
+        """
+        if bit_count <= 0:
+            return 0
+        start = self.current_bit_index
+        end = start + bit_count
+        first_byte = start >> 3
+        last_byte = (end + 7) >> 3
+        if last_byte > len(self.data):
+            raise IndexError(f"tried to read bits {start} to {end} of a {len(self.data) * 8} bit stream")
+        window = int.from_bytes(self.data[first_byte:last_byte], 'big')
+        self.current_bit_index = end
+        return (window >> ((last_byte << 3) - end)) & ((1 << bit_count) - 1)
+
     def fetch(self, bit_count) -> bytes:
+        """
+        reads (bit_count) bits into bytes, bits fill each byte from the top down. when bit_count is not a multiple of 8
+        the last byte holds the leftover bits in its low end
+        """
         if bit_count % 8 == 0 and bit_count > 0 and self.current_bit_index % 8 == 0:
             out = self.data[self.current_bit_index//8:self.current_bit_index//8+bit_count//8]
             self.current_bit_index += bit_count
             return out
 
-        out_buff = bytearray(math.ceil(bit_count / 8))
-        write_bit = 0
-        for i in range(bit_count):
-            current_index = self.current_bit_index // 8 # gets the floor to get the rounded down byte index
-            temp_bit = (self.data[current_index] & (2**(7-self.current_bit_index%8))) != 0 # gets the next bit in line to be read
-            if temp_bit:
-                out_buff[write_bit // 8] |= (2**(7-write_bit%8))
-            write_bit += 1
-            # print(self.data[current_index] & (2**(self.current_bit_index%8)))
-            # print(hex(self.data[current_index]), bin(self.data[current_index]), bin((2**(7-write_bit%8))), write_bit)
-            self.current_bit_index += 1
-        # print("last index: ", write_bit)
-        if len(out_buff) > 0 and write_bit % 8 != 0:
-            out_buff[math.ceil(bit_count / 8)-1] = out_buff[math.ceil(bit_count / 8)-1] >>(8-write_bit % 8)
+        value = self.read_bits(bit_count)
+        full_bytes, leftover = divmod(max(bit_count, 0), 8)
+        if leftover == 0:
+            return bytearray(value.to_bytes(full_bytes, 'big'))
+        out_buff = bytearray((value >> leftover).to_bytes(full_bytes, 'big'))
+        out_buff.append(value & ((1 << leftover) - 1))
         return out_buff
 
+    def read_array(self, count: int, bit_width: int) -> np.ndarray:
+        """
+        reads (count) back to back fields of (bit_width) bits each in one pass, every field is read like read_bits
+        (first bit is the most significant)
+        count: number of fields
+        bit_width: bits per field, 1 to 64
+        returns an unsigned ndarray of the smallest of uint8/16/32/64 that fits bit_width
+        """
+        if not 0 < bit_width <= 64:
+            raise ValueError(f"bit_width has to be between 1 and 64, got {bit_width}")
+        out_bytes = 1 << max(0, (bit_width - 1).bit_length() - 3)
+        if count <= 0:
+            return np.zeros(0, dtype=f"u{out_bytes}")
+        start = self.current_bit_index
+        end = start + count * bit_width
+        first_byte = start >> 3
+        last_byte = (end + 7) >> 3
+        if last_byte > len(self.data):
+            raise IndexError(f"tried to read bits {start} to {end} of a {len(self.data) * 8} bit stream")
+        raw = np.frombuffer(self.data, dtype=np.uint8, count=last_byte - first_byte, offset=first_byte)
+        self.current_bit_index = end
+
+        if start % 8 == 0 and bit_width == out_bytes * 8:
+            # whole aligned bytes, the fields are already big endian ints
+            return raw.view(f">u{out_bytes}").astype(f"u{out_bytes}")
+
+        skip = start - first_byte * 8
+        bits = np.unpackbits(raw)[skip:skip + count * bit_width].reshape(count, bit_width)
+        padded = np.zeros((count, out_bytes * 8), dtype=np.uint8)
+        padded[:, out_bytes * 8 - bit_width:] = bits
+        packed = np.packbits(padded, axis=1)
+        return packed.reshape(-1).view(f">u{out_bytes}").astype(f"u{out_bytes}")
+
     def advance(self, bit_count) -> None:
         self.current_bit_index += bit_count
 
@@ -139,9 +328,9 @@ class BitStream:
         value = 0
         shift = 0
         while True:
-            byte = self.fetch(8)[0]
+            byte = self.read_bits(8)
             value |= (byte & 0x7f) << shift
             if not (byte & 0x80):
                 break
             shift += 7
-        return value
\ No newline at end of file
+        return value
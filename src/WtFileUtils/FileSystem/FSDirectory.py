@@ -156,7 +156,7 @@ class FSDirectory:
             with open(base_dir + "/" + f.file_name, "wb") as x:
                 try:
                     print(f"writing {'/'.join(f.true_name)} to disk")
-                    x.write(f.get_data_disk())
+                    f.write_data_disk(x)
                 except Exception as e:
                     stack_trace = traceback.format_exc()
                     disk_trace = self.stack_trace()
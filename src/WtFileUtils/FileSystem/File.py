@@ -14,6 +14,12 @@ class _BaseFile(ABC):
     def get_data_disk(self):
         pass
 
+    def write_data_disk(self, stream):
+        """
+        writes what get_data_disk returns to a binary stream, files that can stream their output override this
+        """
+        stream.write(self.get_data_disk())
+
 
 class VROMFs_File(_BaseFile):
     """
@@ -43,6 +49,9 @@ class VROMFs_File(_BaseFile):
             temp = json.dumps(temp, indent=4, ensure_ascii=False).encode('utf-8')
         return temp
 
+    def write_data_disk(self, stream):
+        self.VROMFs.write_file(self, stream)
+
     def __eq__(self, other):
         if isinstance(other, str):
             return self.file_name == other
@@ -0,0 +1,47 @@
+import threading
+
+import zstandard as zstd
+
+'''
+a per thread pool of zstd decompressors
+creating a ZstdDecompressor (and loading its dict into it) costs time on every blk, so one is made per dict per thread
+and reused for every file after that
+'''
+_local = threading.local()
+
+
+def _pool_key(zstd_dict):
+    if zstd_dict is None:
+        return None
+    dict_id = zstd_dict.dict_id()
+    if dict_id == 0:  # raw content dicts have no id, fall back to the object itself
+        return "object", id(zstd_dict)
+    return dict_id
+
+
+def get_decompressor(zstd_dict: zstd.ZstdCompressionDict = None) -> zstd.ZstdDecompressor:
+    """
+    returns this threads ZstdDecompressor for zstd_dict (or for no dict), creating it on first use
+    """
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = {}
+    key = _pool_key(zstd_dict)
+    entry = pool.get(key)
+    if entry is None or entry[0] is not zstd_dict:
+        # the dict is kept in the entry so an id() based key cant be reused by a different object
+        entry = (zstd_dict, zstd.ZstdDecompressor(dict_data=zstd_dict) if zstd_dict is not None else zstd.ZstdDecompressor())
+        pool[key] = entry
+    return entry[1]
+
+
+def decompress(data, zstd_dict: zstd.ZstdCompressionDict = None) -> bytes:
+    """
+    decompresses a single zstd frame using the pooled decompressor
+    the frame header is read first, frames that state their content size are decompressed in one shot into a buffer
+    of that size, the rest (some VROMFs entries are written as streams) go through a decompressobj
+    """
+    decompressor = get_decompressor(zstd_dict)
+    if zstd.get_frame_parameters(data).content_size != zstd.CONTENTSIZE_UNKNOWN:
+        return decompressor.decompress(data)
+    return decompressor.decompressobj().decompress(data)
@@ -0,0 +1,169 @@
+import hashlib
+import marshal
+import os
+
+from ..blk.BlkParser import BlkDecoder, BlkContext
+from ..blk.BlockConverter import DuplicatePolicy
+
+'''
+an on disk cache of decoded blks, so files that did not change between game updates are not decoded again
+
+the key of a blk is a blake2b hash of its raw bytes, the name map and zstd dict it was decoded with and the
+DuplicatePolicy, so a new name map or dict never gives back an old result. values are the to_dict output stored with
+marshal (fast to load, only plain python types are in a decoded blk)
+
+the cache directory is kept under max_size bytes, the least recently used files (by mtime, which is bumped on every
+hit) are removed first. eviction goes down to EVICT_TO of max_size, so a full cache only scans its directory again
+after that much has been written instead of on every miss. more than one process can use the same directory, the size
+is then only roughly kept
+'''
+
+FORMAT_VERSION = b"1"
+SUFFIX = ".blkc"
+EVICT_TO = 0.9  # the part of max_size a full cache is trimmed down to
+
+
+class BlkCache:
+    """
+    inputs:
+    path: the cache directory, made if it does not exist
+    max_size: how many bytes of cache files to keep at most
+
+    hits / misses: how many decode calls were answered from the cache and how many had to decode
+    """
+
+    def __init__(self, path: str, max_size: int = 1 << 30):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._digests = {}  # id(name map / dict) -> (the object, its digest), so shared ones are only hashed once
+        os.makedirs(path, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.name.endswith(SUFFIX))
+
+    def _digest_of(self, obj, to_bytes) -> bytes:
+        if obj is None:
+            return b""
+        entry = self._digests.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            entry = (obj, hashlib.blake2b(to_bytes(obj), digest_size=16).digest())
+            self._digests[id(obj)] = entry
+        return entry[1]
+
+    def key(self, dat, name_map=None, zstd_dict=None, policy: str = DuplicatePolicy.PROMOTE) -> str:
+        """
+        the cache key of a blk (dat has to start at the type byte)
+        """
+        h = hashlib.blake2b(dat, digest_size=20)
+        h.update(FORMAT_VERSION + policy.encode("utf-8"))
+        h.update(self._digest_of(name_map, _name_map_bytes))
+        h.update(self._digest_of(zstd_dict, lambda x: x.as_bytes()))
+        return h.hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + SUFFIX)
+
+    def get(self, key: str):
+        """
+        the cached value of key, None when it is not cached (or the file is broken)
+        """
+        file = self._file(key)
+        try:
+            with open(file, "rb") as f:
+                value = marshal.loads(f.read())  # much faster than marshal.load, which reads the file in small parts
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError, OSError):
+            self._remove(file)
+            return None
+        try:
+            os.utime(file)  # marks it as recently used
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        stores value under key, then removes old entries if the cache is over max_size
+        """
+        data = marshal.dumps(value)
+        if len(data) > self.max_size:
+            return
+        file = self._file(key)
+        temp = f"{file}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        try:
+            old_size = os.path.getsize(file)
+        except OSError:
+            old_size = 0
+        os.replace(temp, file)  # readers never see a half written file
+        self._size += len(data) - old_size
+        if self._size > self.max_size:
+            self._evict()
+
+    def decode(self, dat, offset=0, name_map: list[bytearray] = None, zstd_dict=None,
+               policy: str = DuplicatePolicy.PROMOTE, context: BlkContext = None):
+        """
+        BlkDecoder(...).to_dict(policy), answered from the cache when the same blk was decoded before
+        takes the same inputs as BlkDecoder
+        """
+        if context is not None:
+            name_map = context.names if name_map is None else name_map
+            zstd_dict = context.zstd_dict if zstd_dict is None else zstd_dict
+        raw = dat[offset:] if offset else dat
+        flyweight = context is not None and context.flyweights is not None
+        key = self.key(raw, name_map, zstd_dict, policy + ("/flyweight" if flyweight else ""))
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = BlkDecoder(raw, name_map=name_map, zstd_dict=zstd_dict, context=context).to_dict(policy)
+        self.put(key, value)
+        return value
+
+    def _remove(self, file: str) -> None:
+        try:
+            size = os.path.getsize(file)
+            os.remove(file)
+            self._size -= size
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """
+        removes the least recently used files until the cache is down to EVICT_TO of max_size
+        """
+        target = int(self.max_size * EVICT_TO)
+        entries = []
+        total = 0
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, file in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(file)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(SUFFIX):
+                self._remove(entry.path)
+        self._size = 0
+
+
+def _name_map_bytes(name_map) -> bytes:
+    return b"\x00".join(x.encode("utf-8") if isinstance(x, str) else bytes(x) for x in name_map)
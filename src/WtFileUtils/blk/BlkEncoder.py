@@ -0,0 +1,276 @@
+import struct
+
+import numpy as np
+import zstandard as zstd
+
+from ..Exceptions import BlkParseException
+from ..blk.Block import Block
+from ..blk.ParamParser import BLKTypes
+
+'''
+writes blks, the reverse of BlkDecoder
+
+from a Block tree (BlkDecoder(...).parent, or blocks made by hand) nothing is lost, every param keeps the type stored
+in its Chunk
+
+from a dict (to_dict output) the types have to be guessed from the python values, which is ambiguous:
+- bool -> BOOL, str -> STRING, float -> FLOAT, int -> INT (LONG when it does not fit in 32 bits)
+- a list of numbers is taken as one vector param when its length fits one: 2/3/4/12 numbers with a float in them are
+  FLOAT2/3/4/12, 2/3 ints are INT2/INT3 and 4 ints from 0 to 255 are a COLOR. any other list of numbers is that many
+  separate params with the same name, so two FLOAT params with the same name come back as one FLOAT2
+- a list with dicts in it is repeated child blocks (plus repeated params for anything in it that is not a dict)
+- a list that starts with numbers and then has lists in it is what to_dict makes of a repeated vector param, the
+  leading numbers are the first vector and every list after it is one more
+- LONG params that fit in 32 bits come back as INT
+- to_dict output with the default DuplicatePolicy.PROMOTE (or LAST_WINS) can be encoded, the others can not
+'''
+
+_int = struct.Struct("<i")
+_uint = struct.Struct("<I")
+_long = struct.Struct("<q")
+_float = struct.Struct("<f")
+
+
+def _uleb128(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _is_number(value) -> bool:
+    return type(value) is int or type(value) is float
+
+
+def _vector_type(values: list):
+    """
+    the vector type a list of numbers would be stored as, None when it does not fit one
+    """
+    if not values or not all(_is_number(x) for x in values):
+        return None
+    if any(type(x) is float for x in values):
+        return {2: BLKTypes.FLOAT2, 3: BLKTypes.FLOAT3, 4: BLKTypes.FLOAT4, 12: BLKTypes.FLOAT12}.get(len(values))
+    if len(values) == 2:
+        return BLKTypes.INT2
+    if len(values) == 3:
+        return BLKTypes.INT3
+    if len(values) == 4 and all(0 <= x <= 255 for x in values):
+        return BLKTypes.COLOR
+    return None
+
+
+def _infer_params(name: str, value) -> list[tuple[int, object]]:
+    """
+    the (type id, value) of every param a to_dict value stands for, see the top of this file
+    """
+    t = type(value)
+    if t is bool:
+        return [(BLKTypes.BOOL, value)]
+    if t is int:
+        return [(BLKTypes.INT if -0x80000000 <= value <= 0x7FFFFFFF else BLKTypes.LONG, value)]
+    if t is float:
+        return [(BLKTypes.FLOAT, value)]
+    if t is str:
+        return [(BLKTypes.STRING, value)]
+    if t is list or t is tuple:
+        lead = 0
+        while lead < len(value) and _is_number(value[lead]):
+            lead += 1
+        vector = _vector_type(value[:lead])
+        if vector is not None:
+            out = [(vector, list(value[:lead]))]
+            rest = value[lead:]
+        else:
+            out = []
+            rest = value
+        for item in rest:
+            if type(item) is list or type(item) is tuple:
+                item_type = _vector_type(item)
+                if item_type is None:
+                    raise BlkParseException(f"cant encode {name}, {item} is not a vector param")
+                out.append((item_type, list(item)))
+            else:
+                out.extend(_infer_params(name, item))
+        return out
+    raise BlkParseException(f"cant encode {name}, {value!r} has no blk type")
+
+
+class BlkEncoder:
+    """
+    turns a Block tree or a dict into a blk
+    inputs:
+    root: the root Block, or a dict like to_dict gives ({"root": {...}}, the inner dict alone also works)
+
+    the tree is laid out when the encoder is made, to_bytes can then write it in any of the blk types
+    names: the name map of the last to_bytes, for SLIM blks this is what has to be passed to BlkDecoder as name_map
+    """
+
+    def __init__(self, root):
+        if isinstance(root, dict) and len(root) == 1 and type(root.get("root")) is dict:
+            root = root["root"]
+        self.names: list[str] = []
+        self.params_data = bytearray()
+        self._data_offsets: dict[bytes, int] = {}
+        self._string_offsets: dict[str, int] = {}
+        # per param, in block order
+        self._param_names: list[str] = []
+        self._param_types: list[int] = []
+        self._param_payloads: list[int] = []
+        # per block, in block table order
+        self._block_names: list[str] = []
+        self._param_counts: list[int] = []
+        self._block_counts: list[int] = []
+        self._first_block_ids: list[int] = []
+
+        # breadth first, so every blocks children end up next to each other in the block table
+        queue = [("root", root)]
+        read = 0
+        while read < len(queue):
+            name, block = queue[read]
+            read += 1
+            if isinstance(block, Block):
+                params = [(p.name, p.data_type_raw, p.data) for p in block.fields]
+                children = [(child.name, child) for child in block.children]
+            elif isinstance(block, dict):
+                params, children = self._split_dict(block)
+            else:
+                raise BlkParseException(f"cant encode block {name}, expected a Block or a dict")
+            for param_name, type_id, value in params:
+                self._add_param(param_name, type_id, value)
+            self._block_names.append(name)
+            self._param_counts.append(len(params))
+            self._block_counts.append(len(children))
+            self._first_block_ids.append(len(queue) if children else -1)
+            queue.extend(children)
+
+    @staticmethod
+    def _split_dict(block: dict):
+        params = []
+        children = []
+        for key, value in block.items():
+            if type(value) is dict:
+                children.append((key, value))
+                continue
+            if type(value) is list and any(type(x) is dict for x in value):
+                children.extend((key, x) for x in value if type(x) is dict)
+                value = [x for x in value if type(x) is not dict]
+                if not value:
+                    continue
+                if len(value) == 1:
+                    value = value[0]
+            params.extend((key, type_id, x) for type_id, x in _infer_params(key, value))
+        return params, children
+
+    def _add_data(self, raw: bytes) -> int:
+        offset = self._data_offsets.get(raw)
+        if offset is None:
+            self.params_data += b"\x00" * (-len(self.params_data) % 4)
+            offset = len(self.params_data)
+            self.params_data += raw
+            self._data_offsets[raw] = offset
+        return offset
+
+    def _add_param(self, name: str, type_id: int, value) -> None:
+        if value is None:
+            raise BlkParseException(f"cant encode {name}, it has no value")
+        if type_id == BLKTypes.STRING:
+            payload = self._string_offsets.get(value)
+            if payload is None:
+                payload = len(self.params_data)
+                self.params_data += value.encode("utf-8") + b"\x00"
+                self._string_offsets[value] = payload
+        elif type_id == BLKTypes.INT:
+            payload = _uint.unpack(_int.pack(value))[0]
+        elif type_id == BLKTypes.FLOAT:
+            payload = _uint.unpack(_float.pack(value))[0]
+        elif type_id == BLKTypes.BOOL:
+            payload = 1 if value else 0
+        elif type_id == BLKTypes.COLOR:
+            payload = _uint.unpack(bytes(value))[0]
+        elif type_id == BLKTypes.LONG:
+            payload = self._add_data(_long.pack(value))
+        elif type_id in BLKTypes.vector_layouts:
+            dtype, count = BLKTypes.vector_layouts[type_id]
+            if len(value) != count:
+                raise BlkParseException(f"cant encode {name}, {BLKTypes.types[type_id]} needs {count} values")
+            payload = self._add_data(np.asarray(value, dtype=dtype).tobytes())
+        else:
+            raise BlkParseException(f"cant encode {name}, unknown type id {type_id}")
+        self._param_names.append(name)
+        self._param_types.append(type_id)
+        self._param_payloads.append(payload)
+
+    def _name_ids(self, name_map: list[str]) -> dict[str, int]:
+        ids = {}
+        for i, name in enumerate(name_map):
+            ids.setdefault(name, i)
+        for name in self._param_names + self._block_names[1:]:
+            if name not in ids:
+                ids[name] = len(name_map)
+                name_map.append(name)
+        if len(name_map) > 0xFFFFFF:
+            raise BlkParseException("too many names for a blk name map")
+        return ids
+
+    def to_bytes(self, slim: bool = False, compress: bool = False, name_map: list[str] = None, zstd_dict=None,
+                 level: int = 3) -> bytes:
+        """
+        writes the blk
+        slim: write a SLIM blk, the name map is left out and self.names has to be given to the decoder
+        compress: zstd compress the blk (FAT_ZSTD / SLIM_ZSTD, or SLIM_ZSTD_DICT when zstd_dict is passed)
+        name_map: SLIM only, an existing shared name map (list[str]) to use, names it does not have are added to the end
+        of self.names
+        zstd_dict: SLIM only, a zstd.ZstdCompressionDict to compress with
+        level: the zstd compression level
+        """
+        if not slim and (name_map is not None or zstd_dict is not None):
+            raise BlkParseException("name_map and zstd_dict can only be used with slim blks")
+        self.names = list(name_map) if name_map is not None else []
+        ids = self._name_ids(self.names)
+
+        body = bytearray(_uleb128(len(self.names)))
+        if not slim:
+            if self.names:
+                name_blob = "\x00".join(self.names).encode("utf-8") + b"\x00"
+                body += _uleb128(len(name_blob)) + name_blob
+            else:
+                body += _uleb128(0)
+        body += _uleb128(len(self._block_names))
+        body += _uleb128(len(self._param_names))
+        body += _uleb128(len(self.params_data))
+        body += self.params_data
+
+        table = np.zeros((len(self._param_names), 2), dtype="<u4")
+        if len(self._param_names):
+            table[:, 0] = np.array([ids[x] for x in self._param_names], dtype=np.uint32) | \
+                (np.array(self._param_types, dtype=np.uint32) << 24)
+            table[:, 1] = self._param_payloads
+        body += table.tobytes()
+
+        for block_id, (name, param_count, block_count, first_block_id) in enumerate(zip(
+                self._block_names, self._param_counts, self._block_counts, self._first_block_ids)):
+            body += _uleb128(0 if block_id == 0 else ids[name] + 1)  # 0 is root, the rest are name index + 1
+            body += _uleb128(param_count)
+            body += _uleb128(block_count)
+            if block_count > 0:
+                body += _uleb128(first_block_id)
+
+        if not compress:
+            return bytes([0x03 if slim else 0x01]) + bytes(body)
+        if zstd_dict is not None:
+            compressor = zstd.ZstdCompressor(level=level, dict_data=zstd_dict)
+            return bytes([0x05]) + compressor.compress(bytes(body))
+        return bytes([0x04 if slim else 0x02]) + zstd.ZstdCompressor(level=level).compress(bytes(body))
+
+
+def encode_blk(root, slim: bool = False, compress: bool = False, name_map: list[str] = None, zstd_dict=None,
+               level: int = 3) -> bytes:
+    """
+    encodes a Block tree or dict as a blk in one call, see BlkEncoder
+    """
+    return BlkEncoder(root).to_bytes(slim, compress, name_map, zstd_dict, level)
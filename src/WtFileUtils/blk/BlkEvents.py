@@ -0,0 +1,58 @@
+'''
+event types yielded by iter_events
+(START_BLOCK, name)
+(PARAM, name, type_id, value), type_id is one of the BLKTypes constants
+(END_BLOCK, name)
+'''
+from ..blk.ParamTable import ParamWindows
+
+START_BLOCK = "start_block"
+PARAM = "param"
+END_BLOCK = "end_block"
+
+
+def iter_events(decoder):
+    """
+    walks a decoded blk straight from its block and param tables and yields events in document order,
+    a blocks params come first, then its child blocks. no Block or Chunk objects are created, so this works the same on
+    lazy and eager decoders. params are decoded a window at a time (see ParamWindows), so the whole blk is never
+    decoded at once
+
+    decoder: a BlkDecoder
+    """
+    table = decoder.block_table
+    params = ParamWindows(decoder.params)
+    name_map = decoder.names
+
+    stack = [(0, False)]
+    while stack:
+        block_id, finished = stack.pop()
+        name = decoder.block_id_to_name(table.name_ids[block_id])
+        if finished:
+            yield END_BLOCK, name
+            continue
+        yield START_BLOCK, name
+        for name_id, type_id, value in params.get(table.first_param_ids[block_id], table.param_counts[block_id]):
+            yield PARAM, name_map[name_id], type_id, value
+        stack.append((block_id, True))
+        stack.extend((child_id, False) for child_id in reversed(table.child_range(block_id)))
+
+
+def iter_block_events(block):
+    """
+    the same events as iter_events, but from a Block tree, used when the tree is not the whole blk
+    (BlkDecoder(..., paths=[...]))
+
+    block: the Block to start from
+    """
+    stack = [(block, False)]
+    while stack:
+        node, finished = stack.pop()
+        if finished:
+            yield END_BLOCK, node.name
+            continue
+        yield START_BLOCK, node.name
+        for chunk in node.fields:
+            yield PARAM, chunk.name, chunk.data_type_raw, chunk.data
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.children))
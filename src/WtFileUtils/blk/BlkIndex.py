@@ -0,0 +1,141 @@
+import numpy as np
+
+from ..Exceptions import BlkParseException
+from ..blk.BlockTable import BlockTable
+from ..blk.LazyBlock import LazyBlock
+
+
+def split_path(path) -> list[str]:
+    """
+    a path is either a "/" separated string or a list of names, the list form is for names that have a "/" in them
+    (some skin and camo blocks do)
+    """
+    if isinstance(path, str):
+        return [x for x in path.split("/") if x]
+    return list(path)
+
+
+class BlkIndex:
+    """
+    a lookup index over the block table of a blk, for many point lookups without to_dict
+    per block it keeps its parent, first param, child range and a name -> child block ids dict, so finding
+    "a/b/c" is one dict lookup per part of the path. params of a block are indexed by name the first time that block
+    is looked at
+    inputs:
+    decoder: a BlkDecoder (lazy works best, nothing gets decoded that is not looked up)
+    table: the BlockTable to index, defaults to the decoders, see load
+
+    block ids are positions in the block table, root is 0
+    """
+
+    def __init__(self, decoder, table: BlockTable = None):
+        self._decoder = decoder
+        self.table = decoder.block_table if table is None else table
+        table = self.table
+        names = decoder.names
+        self.parents = [-1] * table.count
+        self._children: list[dict[str, list[int]]] = [None] * table.count  # None for blocks without children
+        self._params: list[dict[str, list[int]]] = [None] * table.count  # filled on first lookup
+        for block_id in range(table.count):
+            children = table.child_range(block_id)
+            if not children:
+                continue
+            by_name = {}
+            for child_id in children:
+                self.parents[child_id] = block_id
+                by_name.setdefault(names[table.name_ids[child_id] - 1], []).append(child_id)
+            self._children[block_id] = by_name
+
+    def first_param(self, block_id: int) -> int:
+        return self.table.first_param_ids[block_id]
+
+    def child_range(self, block_id: int) -> range:
+        return self.table.child_range(block_id)
+
+    def name(self, block_id: int) -> str:
+        return self._decoder.block_id_to_name(self.table.name_ids[block_id])
+
+    def children_named(self, block_id: int, name: str) -> list[int]:
+        """
+        the ids of every child block of block_id called name, in document order
+        """
+        children = self._children[block_id]
+        if children is None:
+            return []
+        return list(children.get(name, ()))
+
+    def find(self, path, block_id: int = 0) -> int:
+        """
+        the id of the first block at path (block names below block_id, see split_path), -1 if there is none
+        """
+        for part in split_path(path):
+            children = self._children[block_id]
+            if children is None or part not in children:
+                return -1
+            block_id = children[part][0]
+        return block_id
+
+    def param_ids(self, block_id: int, name: str) -> list[int]:
+        """
+        the param table ids of every param of block_id called name
+        """
+        params = self._params[block_id]
+        if params is None:
+            params = {}
+            first = self.table.first_param_ids[block_id]
+            for i, param_name in enumerate(self._decoder.params.names(first, self.table.param_counts[block_id])):
+                params.setdefault(param_name, []).append(first + i)
+            self._params[block_id] = params
+        return params.get(name, [])
+
+    def params_named(self, block_id: int, name: str) -> list:
+        """
+        the values of every param of block_id called name
+        """
+        params = self._decoder.params
+        return [params.value(int(params.type_ids[i]), int(params.payloads[i])) for i in self.param_ids(block_id, name)]
+
+    def block(self, block_id: int) -> LazyBlock:
+        return LazyBlock(self._decoder, block_id)
+
+    def get(self, path, default=None):
+        """
+        looks up "a/b/c" (or ["a", "b", "c"]) below root, the last part can be a param (its value is returned) or a block
+        (a LazyBlock of it is returned). a param wins over a block with the same name, and when a name is repeated the
+        first one is used
+        """
+        parts = split_path(path)
+        if not parts:
+            return self.block(0)
+        block_id = self.find(parts[:-1])
+        if block_id == -1:
+            return default
+        param_ids = self.param_ids(block_id, parts[-1])
+        if param_ids:
+            params = self._decoder.params
+            return params.value(int(params.type_ids[param_ids[0]]), int(params.payloads[param_ids[0]]))
+        children = self.children_named(block_id, parts[-1])
+        if children:
+            return self.block(children[0])
+        return default
+
+    def save(self, stream) -> None:
+        """
+        writes the block table to a binary stream (as a numpy .npz) so load can skip reading it from the blk again
+        """
+        table = self.table
+        np.savez(stream, name_ids=np.asarray(table.name_ids, dtype=np.int64),
+                 param_counts=np.asarray(table.param_counts, dtype=np.int64),
+                 block_counts=np.asarray(table.block_counts, dtype=np.int64),
+                 first_block_ids=np.asarray(table.first_block_ids, dtype=np.int64))
+
+    @classmethod
+    def load(cls, stream, decoder) -> "BlkIndex":
+        """
+        builds the index of decoder from what save wrote, the saved table has to be from the same blk
+        """
+        with np.load(stream, allow_pickle=False) as saved:
+            columns = [saved[x].tolist() for x in ("name_ids", "param_counts", "block_counts", "first_block_ids")]
+        if len(columns[0]) != decoder.num_of_blocks or sum(columns[1]) != decoder.num_of_params:
+            raise BlkParseException("saved BlkIndex does not match this blk")
+        return cls(decoder, BlockTable.from_columns(*columns))
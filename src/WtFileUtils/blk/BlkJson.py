@@ -0,0 +1,123 @@
+import json
+from json.encoder import encode_basestring
+
+from ..blk.ParamTable import ParamWindows
+
+INDENT = b"    "
+
+
+def _float_str(value: float) -> str:
+    # same output json.dumps gives for floats
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "Infinity"
+    if value == float("-inf"):
+        return "-Infinity"
+    return float.__repr__(value)
+
+
+def _encode_value(value, level: int) -> bytes:
+    """
+    encodes a single param value as it would appear at (level) in json.dumps(..., indent=4, ensure_ascii=False)
+    """
+    t = type(value)
+    if t is str:
+        return encode_basestring(value).encode("utf-8")
+    if t is int:
+        return int.__repr__(value).encode("utf-8")
+    if t is float:
+        return _float_str(value).encode("utf-8")
+    if t is bool:
+        return b"true" if value else b"false"
+    if value is None:
+        return b"null"
+    out = json.dumps(value, indent=4, ensure_ascii=False)
+    return out.replace("\n", "\n" + "    " * level).encode("utf-8")
+
+
+class _EncodedNames:
+    """
+    json keys (quoted name + ': ') for a name map, each name is encoded the first time it is used and then reused
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.keys = [None] * len(names)
+
+    def __getitem__(self, name_index: int) -> bytes:
+        key = self.keys[name_index]
+        if key is None:
+            key = encode_basestring(self.names[name_index]).encode("utf-8") + b": "
+            self.keys[name_index] = key
+        return key
+
+
+def write_json(decoder, stream, chunk_size: int = 1 << 16) -> None:
+    """
+    writes a blk as json to a binary file like object (anything with .write(bytes)), straight from the block and
+    param tables. the output is byte for byte what json.dumps(decoder.to_dict(), indent=4, ensure_ascii=False) gives,
+    but the dict and the full string are never built. data is written out every (chunk_size) bytes
+
+    decoder: a BlkDecoder, lazy decoders work best as no Block objects are needed
+    """
+    table = decoder.block_table
+    params = ParamWindows(decoder.params)  # decoded a window at a time, the whole blk is never decoded at once
+    keys = _EncodedNames(decoder.names)
+
+    def block_groups(block_id):
+        # (name index, [(is_block, value or block id), ...]) in the same order Block.to_dict adds keys
+        groups = {}
+        for name_id, _, value in params.get(table.first_param_ids[block_id], table.param_counts[block_id]):
+            groups.setdefault(name_id, []).append((False, value))
+        for child_id in table.child_range(block_id):
+            groups.setdefault(table.name_ids[child_id] - 1, []).append((True, child_id))
+        return groups.items()
+
+    # a frame is [is_dict, iterator, level, closing bracket, first]
+    stack = []
+    out = bytearray(b"{\n" + INDENT + b'"root": ')
+
+    def enter(item, level):
+        is_block, value = item
+        if not is_block:
+            out.extend(_encode_value(value, level))
+            return
+        groups = block_groups(value)
+        if not groups:
+            out.extend(b"{}")
+            return
+        out.extend(b"{")
+        stack.append([True, iter(groups), level + 1, b"}", True])
+
+    enter((True, 0), 1)
+    while stack:
+        frame = stack[-1]
+        is_dict, items, level, closer, first = frame
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            out.extend(b"\n" + INDENT * (level - 1) + closer)
+            continue
+        out.extend(b"\n" if first else b",\n")
+        out.extend(INDENT * level)
+        frame[4] = False
+        if is_dict:
+            name_index, grouped = item
+            out.extend(keys[name_index])
+            if len(grouped) == 1:
+                enter(grouped[0], level)
+            else:
+                first_is_block, first_value = grouped[0]
+                if not first_is_block and type(first_value) is list:
+                    # to_dict appends duplicates onto a list value instead of wrapping it, match that
+                    grouped = [(False, v) for v in first_value] + grouped[1:]
+                out.extend(b"[")
+                stack.append([False, iter(grouped), level + 1, b"]", True])
+        else:
+            enter(item, level)
+        if len(out) >= chunk_size:
+            stream.write(bytes(out))
+            out.clear()
+    out.extend(b"\n}")
+    stream.write(bytes(out))
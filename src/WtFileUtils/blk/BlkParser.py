@@ -1,11 +1,79 @@
-import zstandard
-import zstandard as zstd
+import json
+import sys
 
+import numpy as np
+
+from ..Exceptions import BlkParseException
 from ..blk.FileInfo import FileType
 from ..blk.Block import Block
-from ..blk.Chunk import ChunkParser, Chunk
-from ..blk.ParamParser import BLKTypes
-from ..DataHandler import DataHandler
+from ..blk.BlockConverter import DuplicatePolicy
+from ..blk.BlockTable import BlockTable
+from ..blk.BlkEvents import iter_events, iter_block_events
+from ..blk.BlkIndex import BlkIndex, split_path
+from ..blk.BlkJson import write_json
+from ..blk.BlkPaths import PathMatcher, select_blocks
+from ..blk.LazyBlock import LazyBlock
+from ..blk.ParamParser import BLKTypes, FlyweightTable, SharedStrings
+from ..blk.ParamTable import ParamTable
+from .. import ZstdPool
+from ..DataHandler import DataHandler, DataCursor
+
+
+def decompress_blk(blk_type: FileType, dat, offset=0, zstd_dict=None) -> bytes:
+    """
+    decompresses a zstd blk (everything after the type byte) with a pooled decompressor, see ZstdPool.py
+    """
+    if blk_type.needs_dict():
+        if zstd_dict is None:
+            print("BAD DICT")
+        return ZstdPool.decompress(dat[offset + 1:], zstd_dict)
+    return ZstdPool.decompress(dat[offset + 1:])
+
+
+def decode_name_map(name_map: list[bytes]) -> list[str]:
+    """
+    decodes (and interns) an external name map, like the one stored in a VROMFs, for use by SLIM blks
+    """
+    names = []
+    for name in name_map:
+        try:
+            names.append(sys.intern(name.decode("utf-8")))
+        except UnicodeDecodeError:
+            names.append(sys.intern("BADBADBAD"+name.decode("utf-8", errors="ignore")))
+    return names
+
+
+def key_name_ids(key: str, names: list[str]) -> list[int]:
+    """
+    the indexes of key in a decoded name map, empty when it is not in it
+    when checking many SLIM blks that share one name map this is done once and passed to has_key / blk_has_key
+    """
+    return [i for i, x in enumerate(names) if x == key]
+
+
+class BlkContext:
+    """
+    everything that can be shared between blks that are decoded together (see BlkDecoder.decode_many), set up once
+    instead of for every blk
+    inputs:
+    name_map: the name map for SLIM blks, raw or already decoded by decode_name_map, it is decoded here once
+    zstd_dict: the zstd dict for SLIM_ZSTD_DICT blks, its decompressor is kept in ZstdPool and reused by every blk
+
+    flyweight: share identical vector / COLOR values across the whole batch as tuples, see FlyweightTable
+    max_flyweights: how many distinct values the flyweight table holds at most
+    max_strings: how many distinct strings the shared string table holds at most
+
+    strings: the SharedStrings of the batch, strings repeated across files are only decoded once
+    """
+
+    def __init__(self, name_map: list[bytearray] = None, zstd_dict=None, flyweight=False,
+                 max_flyweights: int = 1 << 16, max_strings: int = 1 << 16):
+        if name_map is not None and len(name_map) > 0 and not isinstance(name_map[0], str):
+            name_map = decode_name_map(name_map)
+        self.names = name_map
+        self.zstd_dict = zstd_dict
+        self.strings = SharedStrings(max_strings)
+        self.flyweights = FlyweightTable(max_flyweights) if flyweight else None
 
 
 class BlkDecoder:
@@ -16,106 +84,241 @@ class BlkDecoder:
     offset: how far along into the data the blk starts
     name_map: an optional parameter for blks that have a name map, see FileInfo.py for more info
     zstd_dict: an optional parameter for blks that have a zstd dict, see FileInfo.py for more info
+    when decoding many SLIM blks that share one name map, decode it once with decode_name_map and pass the list[str],
+    it is then used as is instead of being decoded again for every blk
+    lazy: only parse the header, name map and section offsets. blocks and params are then decoded the first time they
+    are accessed through .root, a read only Mapping (see LazyBlock.py). .parent is not built in this mode
+    paths: optional list of path patterns like "root/weapon_presets/*" or "**/armor" (see BlkPaths.py), only the
+    matching blocks / params and the blocks above them are decoded into .parent, everything else is skipped.
+    cant be used together with lazy
+    context: a BlkContext shared with other blks, its name map and zstd dict are used when name_map / zstd_dict are
+    not passed. see decode_many
+    flyweight: identical vector (FLOAT2/3/4/12, INT2/3) and COLOR values are decoded into one shared tuple instead of a
+    new list each, which saves a lot of memory on big blks. as they are tuples a repeated vector param shows up in
+    to_dict as a list of tuples instead of being appended to the first one. a context made with flyweight=True
+    shares its table with every blk of the batch
     """
-    def __init__(self, dat, offset=0, name_map:list[bytearray] = None, zstd_dict = None):
+    def __init__(self, dat, offset=0, name_map:list[bytearray] = None, zstd_dict = None, lazy=False, paths=None,
+                 context: BlkContext = None, flyweight=False):
+        if lazy and paths is not None:
+            raise ValueError("paths can not be used with lazy, a lazy blk already only decodes what is accessed")
+        shared_strings = None
+        flyweights = None
+        if context is not None:
+            name_map = context.names if name_map is None else name_map
+            zstd_dict = context.zstd_dict if zstd_dict is None else zstd_dict
+            shared_strings = context.strings
+            flyweights = context.flyweights
+        if flyweights is None and flyweight:
+            flyweights = FlyweightTable()
         self.data = None
         self.blkType = FileType(dat[0+offset])  # gets blk type, the first byte
         if not self.blkType.is_zstd():
-            self.data = DataHandler(dat, offset=offset+1, read_from_start=False)
+            self.data = DataCursor(dat, offset=offset+1)
         else:
-            if self.blkType.needs_dict():
-                if zstd_dict is None:
-                    print("BAD DICT")
-                # d = zstd.ZstdCompressionDict(zstd_dict)
-                d= zstd_dict
-                raw = zstd.ZstdDecompressor(d).decompress(dat[1:])
-                self.data = DataHandler(raw, offset=offset, read_from_start=False)
-            else:
-                try:
-                    raw = zstd.decompress(dat[1:])
-                except zstd.ZstdError:
-                    # only done because some zstd data in VROMFS can be in streams instead of standard format
-                    x = zstd.ZstdDecompressor().stream_reader(dat[1:])
-                    raw = x.read()
-                    x.close()
-                self.data = DataHandler(raw, offset=offset, read_from_start=False)
+            self.data = DataCursor(decompress_blk(self.blkType, dat, offset, zstd_dict))
         self.names_in_name_map = self.decode_uleb128()  # gets the number of names in the name map
         self.names = None
         if self.blkType.is_slim():
             if name_map is None:
                 print("BAD NAME MAP")
-            self.names = []
-            for name in name_map:
-                try:
-                    self.names.append(name.decode("utf-8"))
-                except UnicodeDecodeError:
-                    self.names.append("BADBADBAD"+name.decode("utf-8", errors="ignore"))
+            if len(name_map) > 0 and isinstance(name_map[0], str):
+                self.names = name_map  # already decoded by decode_name_map, shared between every blk that uses it
+            else:
+                self.names = decode_name_map(name_map)
         else:
             self.name_map_size = self.decode_uleb128()  # gets the size of the name map
 
-            self.names = [x.decode("utf-8") for x in self.data.fetch(self.name_map_size - 1).split(b"\x00")]
-            # print(self.names)
-            self.data.advance(1)
+            if self.name_map_size > 0:
+                name_map_raw = self.data.fetch(self.name_map_size - 1).tobytes()
+                self.names = [x.decode("utf-8") for x in name_map_raw.split(b"\x00")]
+                # print(self.names)
+                self.data.advance(1)
+            else:
+                self.names = []  # a blk with no names at all (only an empty root)
             if len(self.names) != self.names_in_name_map:
                 print("RED ALERT")
         self.num_of_blocks = self.decode_uleb128()
         self.num_of_params = self.decode_uleb128()
         self.params_data_size = self.decode_uleb128()
-        self.params_data = self.data.fetch(self.params_data_size)  # used later on, data
-        '''
-        here we are are skipping results creation and starting with chunks
-        assume we are doing let chunks
-        '''
-        chunks = []
-        parser = ChunkParser(self.names, BLKTypes(self.names, self.params_data))
-        for i in range(self.num_of_params):
-            chunks.append(parser.parse(self.data.fetch(8)))
-        # chunks = Chunks(self.data, self.num_of_params, self.names, B)
+        self.params_data = self.data.fetch(self.params_data_size).tobytes()  # used later on, data
+        self.converter = BLKTypes(self.names, self.params_data, shared_strings, flyweights)
+        self.params_raw = self.data.fetch(self.num_of_params * 8)
+        # the param table is only split into columns here, values are decoded when something asks, see ParamTable.py
+        self.params = ParamTable(self.params_raw, self.num_of_params, self.names, self.converter)
+        self.lazy = lazy
+        self.paths = paths if paths is None or isinstance(paths, PathMatcher) else PathMatcher(paths)
+        self._block_table = None
+        self._index = None
+        self.parent = None
+        if lazy:
+            # everything past this point is decoded on access, see LazyBlock.py
+            self.root = LazyBlock(self, 0)
+            return
+        if self.paths is not None:
+            self.parent = select_blocks(self, self.paths)
+            return
+        table = self.block_table
         blocks = []
-        for i in range(self.num_of_blocks):  # this creates all the blocks
-            name_id = self.decode_uleb128()
-            param_count = self.decode_uleb128()
-            block_count = self.decode_uleb128()
-            if block_count > 0:
-                first_block_id = self.decode_uleb128()
-            else:
-                first_block_id = -1
-            # print(self.block_id_to_name(name_id), name_id)
-            blocks.append(Block(self.block_id_to_name(name_id), param_count, block_count, first_block_id))
+        for i in range(self.num_of_blocks):  # this creates all the blocks, each pointing at its params in the table
+            blocks.append(Block(self.block_id_to_name(table.name_ids[i]), table.param_counts[i],
+                                table.block_counts[i], table.first_block_ids[i], self.params,
+                                table.first_param_ids[i]))
 
         # if current_t > 0:
         #     print(f"After block creation and final file read: {time.perf_counter() - current_t}")
 
-        result_ptr = 0
-        for block in blocks:  # this grabs all the values and puts them in their correct blocks
-            field_count = block.param_count
-            for i in range(field_count):
-                block.add_field(chunks[result_ptr + i])
-            result_ptr += field_count
-
-        # if current_t > 0:
-        #     print(f"After block param matching: {time.perf_counter() - current_t}")
-
         self.parent = blocks[0]
         self.from_blocks_with_parent(self.parent, blocks)
 
         # if current_t > 0:
         #     print(f"After block hierarchy creation: {time.perf_counter() - current_t}")
 
-    def to_dict(self):
-        return self.parent.to_dict()
+    @staticmethod
+    def decode_many(payloads, name_map: list[bytearray] = None, zstd_dict=None, lazy=False, paths=None,
+                    flyweight=False):
+        """
+        decodes many blks that share one name map / zstd dict, yielding a BlkDecoder for each payload in order
+        the name map, zstd decompressor, decoded strings, flyweight table and path patterns are set up once for the
+        whole batch (see BlkContext) instead of once per blk
+        payloads: an iterable of raw blk data, each starting at its type byte
+        """
+        context = BlkContext(name_map, zstd_dict, flyweight)
+        if paths is not None and not isinstance(paths, PathMatcher):
+            paths = PathMatcher(paths)
+        for dat in payloads:
+            yield BlkDecoder(dat, lazy=lazy, paths=paths, context=context)
+
+    @property
+    def block_table(self) -> BlockTable:
+        """
+        the parsed block table, lazy decoders only read it the first time a block is accessed
+        """
+        if self._block_table is None:
+            self._block_table = BlockTable(self.data, self.num_of_blocks)
+        return self._block_table
+
+    @property
+    def index(self) -> BlkIndex:
+        """
+        a BlkIndex for point lookups, built the first time it is used
+        """
+        if self._index is None:
+            self._index = BlkIndex(self)
+        return self._index
+
+    def get(self, path, default=None):
+        """
+        looks up a param value or block by its path below root, see BlkIndex.get
+        """
+        return self.index.get(path, default)
+
+    def save_index(self, stream) -> None:
+        """
+        writes the index to a binary stream to be cached next to the blk, see BlkIndex.save
+        """
+        self.index.save(stream)
+
+    def load_index(self, stream) -> BlkIndex:
+        """
+        uses an index written by save_index, on a lazy decoder this also skips reading the block table
+        """
+        self._index = BlkIndex.load(stream, self)
+        if self._block_table is None:
+            self._block_table = self._index.table
+        return self._index
+
+    def to_dict(self, policy: str = DuplicatePolicy.PROMOTE):
+        if self.lazy:
+            return self.root.to_dict(policy)
+        return self.parent.to_dict(policy)
+
+    def to_json(self, stream):
+        """
+        writes the blk as indent=4 json to a binary stream without building to_dict() first, see BlkJson.py
+        """
+        if self.paths is not None:  # only part of the blk was decoded, the tables would give the whole thing
+            stream.write(json.dumps(self.to_dict(), indent=4, ensure_ascii=False).encode("utf-8"))
+            return
+        write_json(self, stream)
+
+    def iter_events(self):
+        """
+        yields start_block / param / end_block events for the whole blk (or the selected parts of it), see BlkEvents.py
+        """
+        if self.paths is not None:
+            return iter_block_events(self.parent)
+        return iter_events(self)
+
+    def to_arrays(self, name: str, path: str = None) -> np.ndarray:
+        """
+        gathers every vector param (FLOAT2/3/4/12, INT2/3) called name into one (N, k) ndarray, read straight from
+        params_data without building python lists, rows are in document order
+        name: the param name
+        path: optional block names below root, "/" separated (like "weapons/weapon") or a list, only params inside the
+        matched blocks (and their children) are used. every block matching the path is used
+        all the matched params have to share one type, otherwise BlkParseException is raised
+        returns an empty (0, 0) array when nothing matches
+        """
+        params = self.params
+        name_ids = [i for i, x in enumerate(self.names) if x == name]
+        mask = np.isin(params.name_ids, name_ids) & np.isin(params.type_ids, list(BLKTypes.vector_layouts))
+        if path is not None:
+            mask &= self._subtree_param_mask(path)
+        selected = np.flatnonzero(mask)
+        type_ids = np.unique(params.type_ids[selected]).tolist()
+        if len(type_ids) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        if len(type_ids) > 1:
+            raise BlkParseException(f"params named {name} have mixed types "
+                                    f"{[BLKTypes.types[x] for x in type_ids]}, cant put them in one array")
+        dtype, count = BLKTypes.vector_layouts[type_ids[0]]
+        offsets = params.payloads[selected].astype(np.int64)
+        if len(offsets) and offsets.max() + np.dtype(dtype).itemsize * count > len(self.params_data):
+            raise BlkParseException(f"a {name} param points past the end of params_data")
+        return self.converter.gather_array(offsets, dtype, count)
+
+    def has_key(self, key: str, name_ids: list[int] = None) -> bool:
+        """
+        true if any param or block in the blk is called key, only the name ids in the param and block tables are
+        looked at, nothing is decoded and no tree is built. the param table is checked first as it is already split
+        into columns, the block table is only read when no param matched
+        name_ids: key_name_ids(key, shared name map) for SLIM blks, so the name map is not searched again for every blk
+        """
+        if name_ids is None or not self.blkType.is_slim():
+            name_ids = key_name_ids(key, self.names)
+        if not name_ids:
+            return False
+        if np.isin(self.params.name_ids, name_ids).any():
+            return True
+        block_name_ids = np.asarray(self.block_table.name_ids, dtype=np.int64)
+        return bool(np.isin(block_name_ids, [i + 1 for i in name_ids]).any())
+
+    def _subtree_param_mask(self, path) -> np.ndarray:
+        """
+        marks the params of every block matching path (see to_arrays) and of all blocks under them
+        """
+        table = self.block_table
+        matched = [0]
+        for part in split_path(path):
+            matched = [child for block_id in matched for child in table.child_range(block_id)
+                       if self.block_id_to_name(table.name_ids[child]) == part]
+        mask = np.zeros(self.num_of_params, dtype=bool)
+        seen = set()
+        stack = matched
+        while stack:
+            block_id = stack.pop()
+            if block_id in seen:
+                continue
+            seen.add(block_id)
+            start = table.first_param_ids[block_id]
+            mask[start:start + table.param_counts[block_id]] = True
+            stack.extend(table.child_range(block_id))
+        return mask
 
     def decode_uleb128(self):
         """Decodes a ULEB128 encoded value."""
-        value = 0
-        shift = 0
-        while True:
-            byte = self.data.fetch(1)[0]
-            value |= (byte & 0x7f) << shift
-            if not (byte & 0x80):
-                break
-            shift += 7
-        return value
+        return self.data.decode_uleb128()
 
     def block_id_to_name(self, block_id):
         if block_id == 0:
@@ -124,9 +327,66 @@ class BlkDecoder:
             return self.names[block_id - 1]
 
     def from_blocks_with_parent(self, parent, blocks):
-        for i in range(parent.blocks_count):
-            parent.children.append(blocks[i + parent.first_block_id])
-            self.from_blocks_with_parent(blocks[i + parent.first_block_id], blocks)
+        """
+        links every block under parent to its children, done with an explicit stack so deep blks dont recurse
+        """
+        stack = [parent]
+        while stack:
+            block = stack.pop()
+            children = blocks[block.first_block_id:block.first_block_id + block.blocks_count]
+            block.children.extend(children)
+            stack.extend(children)
+
+
+def iter_blk_events(dat, offset=0, name_map: list[bytearray] = None, zstd_dict=None):
+    """
+    a one pass, event based reader for when the whole Block tree is not needed
+    takes the same inputs as BlkDecoder and yields the events described in BlkEvents.py
+    """
+    return BlkDecoder(dat, offset=offset, name_map=name_map, zstd_dict=zstd_dict, lazy=True).iter_events()
+
+
+def blk_has_key(dat, key: str, offset=0, name_map: list[bytearray] = None, zstd_dict=None,
+                name_ids: list[int] = None) -> bool:
+    """
+    checks if a blk has a param or block called key without decoding it, see BlkDecoder.has_key
+    takes the same inputs as BlkDecoder. no decoder is made, only the name id columns of the param and block tables
+    are read. a SLIM blk whose (shared) name map does not have key at all is ruled out before it is even decompressed
+    name_ids: key_name_ids(key, decoded shared name map), pass it when checking many SLIM blks so the name map is only
+    searched once. FAT blks have their own name map and always search it
+    """
+    blk_type = FileType(dat[offset])
+    if blk_type.is_slim():
+        if name_ids is None:
+            if name_map is None:
+                raise BlkParseException("SLIM blk needs a name map")
+            if len(name_map) > 0 and not isinstance(name_map[0], str):
+                name_map = decode_name_map(name_map)
+            name_ids = key_name_ids(key, name_map)
+        if not name_ids:
+            return False
+    if blk_type.is_zstd():
+        data = DataCursor(decompress_blk(blk_type, dat, offset, zstd_dict))
+    else:
+        data = DataCursor(dat, offset=offset + 1)
+    data.decode_uleb128()  # number of names in the name map
+    if not blk_type.is_slim():
+        name_map_size = data.decode_uleb128()
+        names = []
+        if name_map_size > 0:
+            names = data.fetch(name_map_size - 1).tobytes().split(b"\x00")
+            data.advance(1)
+        name_ids = key_name_ids(key.encode("utf-8"), names)
+        if not name_ids:
+            return False
+    num_of_blocks = data.decode_uleb128()
+    num_of_params = data.decode_uleb128()
+    data.advance(data.decode_uleb128())  # params_data, values are never needed here
+    param_name_ids = np.frombuffer(data.fetch(num_of_params * 8), dtype="<u4")[0::2] & 0xFFFFFF
+    if np.isin(param_name_ids, name_ids).any():
+        return True
+    block_name_ids = np.asarray(BlockTable(data, num_of_blocks).name_ids, dtype=np.int64)
+    return bool(np.isin(block_name_ids, [i + 1 for i in name_ids]).any())
 
 
 class BlkBytes:
@@ -144,22 +404,8 @@ class BlkBytes:
         if not self.blkType.is_zstd():
             self.data = DataHandler(dat, offset=offset+1, read_from_start=False)
         else:
-            if self.blkType.needs_dict():
-                if zstd_dict is None:
-                    print("BAD DICT")
-                # d = zstd.ZstdCompressionDict(zstd_dict)
-                d= zstd_dict
-                raw = zstd.ZstdDecompressor(d).decompress(dat[1:])
-                self.data = DataHandler(raw, offset=offset, read_from_start=False)
-            else:
-                try:
-                    raw = zstd.decompress(dat[1:])
-                except zstd.ZstdError:
-                    # only done because some zstd data in VROMFS can be in streams instead of standard format
-                    x = zstd.ZstdDecompressor().stream_reader(dat[1:])
-                    raw = x.read()
-                    x.close()
-                self.data = DataHandler(raw, offset=offset, read_from_start=False)
+            self.data = DataHandler(decompress_blk(self.blkType, dat, offset, zstd_dict), offset=0,
+                                    read_from_start=False)
         self.names_in_name_map, temp = self.decode_uleb128()  # gets the number of names in the name map
         self.bytes += temp
         # self.names = None
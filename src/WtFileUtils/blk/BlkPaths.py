@@ -0,0 +1,138 @@
+from fnmatch import fnmatchcase
+
+from ..blk.Block import Block
+
+'''
+path patterns for BlkDecoder(..., paths=[...])
+a pattern is "/" separated and starts at the root block, so "root/weapon_presets/*" or "root/**/armor"
+every part is an fnmatch pattern (*, ?, [abc]) that matches one block or param name, "**" matches any number of
+blocks (including none), so "**/armor" finds every armor block or param anywhere in the blk
+
+a block whose path matches is decoded whole (all its params and children), a param whose path matches is decoded on
+its own, the blocks leading down to anything that matched are kept (with only the matched parts inside them) and
+everything else is skipped
+'''
+
+
+class PathMatcher:
+    """
+    matches block / param paths against a set of patterns one name at a time
+    a state is a frozenset of (pattern index, parts matched so far), walking down the tree only needs the parents state
+    and the childs name. an empty state means nothing below can match
+    inputs:
+    patterns: an iterable of pattern strings
+    """
+
+    def __init__(self, patterns):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns = [tuple(x for x in pattern.split("/") if x) for pattern in patterns]
+        self._advanced = {}
+        self.start = self._closure((i, 0) for i in range(len(self.patterns)))
+
+    def _closure(self, states) -> frozenset:
+        # a ** can match no names at all, so whatever follows it is also live
+        out = set()
+        stack = list(states)
+        while stack:
+            state = stack.pop()
+            if state in out:
+                continue
+            out.add(state)
+            pattern_id, pos = state
+            parts = self.patterns[pattern_id]
+            if pos < len(parts) and parts[pos] == "**":
+                stack.append((pattern_id, pos + 1))
+        return frozenset(out)
+
+    def advance(self, states: frozenset, name: str) -> frozenset:
+        """
+        the state after going down into a block or param called name
+        """
+        key = (states, name)
+        out = self._advanced.get(key)
+        if out is None:
+            nxt = []
+            for pattern_id, pos in states:
+                parts = self.patterns[pattern_id]
+                if pos == len(parts):
+                    continue
+                if parts[pos] == "**":
+                    nxt.append((pattern_id, pos))
+                elif fnmatchcase(name, parts[pos]):
+                    nxt.append((pattern_id, pos + 1))
+            out = self._closure(nxt)
+            self._advanced[key] = out
+        return out
+
+    def matches(self, states: frozenset) -> bool:
+        """
+        true if any pattern has been fully matched
+        """
+        patterns = self.patterns
+        return any(pos == len(patterns[pattern_id]) for pattern_id, pos in states)
+
+
+def select_blocks(decoder, matcher: PathMatcher) -> Block:
+    """
+    builds the Block tree of a decoder with only the parts matched by matcher, see the top of this file
+    blocks that can not lead to a match are skipped without touching their params
+    returns the root Block, which is always there (empty when nothing matched)
+    """
+    table = decoder.block_table
+    params = decoder.params
+    names = decoder.names
+    name_ids = params.name_ids
+
+    # first pass, parents before children: what each visited block keeps
+    order = []  # (block_id, parent index in order, whole block?, selected param ids)
+    stack = [(0, -1, matcher.start, False)]
+    while stack:
+        block_id, parent, states, whole = stack.pop()
+        if not whole:
+            states = matcher.advance(states, decoder.block_id_to_name(table.name_ids[block_id]))
+            if not states:
+                continue
+            whole = matcher.matches(states)
+        selected = None
+        if not whole:
+            param_range = table.param_range(block_id)
+            selected = [param_range.start + i
+                        for i, name_id in enumerate(name_ids[param_range.start:param_range.stop].tolist())
+                        if matcher.matches(matcher.advance(states, names[name_id]))]
+        order.append((block_id, parent, whole, selected))
+        index = len(order) - 1
+        stack.extend((child_id, index, states, whole) for child_id in reversed(table.child_range(block_id)))
+
+    if not order:  # not even root matched the start of a pattern
+        return Block("root", 0, 0, -1)
+
+    # second pass, children before parents: a block is kept if it has anything in it that was matched
+    keep = [False] * len(order)
+    keep[0] = True
+    for index in range(len(order) - 1, -1, -1):
+        block_id, parent, whole, selected = order[index]
+        if whole or selected or keep[index]:
+            keep[index] = True
+            if parent >= 0:
+                keep[parent] = True
+
+    built = [None] * len(order)
+    for index, (block_id, parent, whole, selected) in enumerate(order):
+        if not keep[index]:
+            continue
+        name = decoder.block_id_to_name(table.name_ids[block_id])
+        if whole:
+            block = Block(name, table.param_counts[block_id], table.block_counts[block_id],
+                          table.first_block_ids[block_id], params, table.first_param_ids[block_id])
+        else:
+            block = Block(name, len(selected), 0, table.first_block_ids[block_id])
+            for param_id in selected:
+                block.add_field(params.chunks(param_id, 1)[0])
+        built[index] = block
+        if parent >= 0:
+            parent_block = built[parent]
+            parent_block.children.append(block)
+            if not order[parent][2]:  # pruned blocks count only what they kept
+                parent_block.blocks_count = len(parent_block.children)
+    return built[0]
@@ -1,45 +1,60 @@
 from ..blk.Chunk import Chunk
+from ..blk.BlockConverter import DuplicatePolicy, convert_block, walk
 
 
 class Block:
-    def __init__(self, name, param_count, blocks_count, first_block_id):
+    """
+    a single block of a blk
+    blocks made by BlkDecoder do not hold their params, they point into the decoders ParamTable (params, first_param)
+    and only build values / Chunks when asked. blocks made by hand (or after add_field) keep their own list of Chunks
+    """
+    __slots__ = ("name", "param_count", "blocks_count", "first_block_id", "children", "_fields", "_params",
+                 "_first_param")
+
+    def __init__(self, name, param_count, blocks_count, first_block_id, params=None, first_param=0):
         self.name = name
         self.param_count = param_count
         self.blocks_count = blocks_count
         self.first_block_id = first_block_id
         self.children = []
-        self.fields: list[Chunk] = []
+        self._params = params
+        self._first_param = first_param
+        self._fields: list[Chunk] = [] if params is None else None
+
+    @property
+    def fields(self) -> list[Chunk]:
+        if self._fields is None:
+            return self._params.chunks(self._first_param, self.param_count)
+        return self._fields
 
     def get_basic(self) -> tuple:
         return self.name, self.param_count, self.blocks_count, self.first_block_id
 
     def add_field(self, chunk: Chunk):
-        self.fields.append(chunk)
+        if self._fields is None:
+            self._fields = self.fields
+        self._fields.append(chunk)
+
+    def iter_params(self):
+        if self._fields is None:
+            return self._params.iter_params(self._first_param, self.param_count)
+        return ((f.name, f.data) for f in self._fields)
+
+    def walk(self):
+        """
+        every block from this one down, parents first, without recursion
+        """
+        return walk(self)
+
+    def iter_children(self):
+        return iter(self.children)
 
     '''
     function to convert data to more pythonic data type
     also used when converting blk to json as a python dict is basically a json
-    
-    works by recursively making a dictionary by adding parameters, then adding the children blocks dict to this dict.
+
+    policy decides what happens to repeated names, see DuplicatePolicy in BlockConverter.py. the default matches
+    the json output of the rest of the project
     '''
-    def to_dict(self) -> dict:
-        payload = {}
-        for f in self.fields:
-            temp = {f.name: f.data}
-            key = f.name
-            if key in list(payload.keys()):
-                if type(payload[key]) is not list:
-                    payload[key] = [payload[key]]
-                payload[key].append(temp[key])
-            else:
-                payload.update(temp)
-        for f in self.children:
-            temp = f.to_dict()
-            key = list(temp.keys())[0]
-            if key in list(payload.keys()):
-                if type(payload[key]) is not list:
-                    payload[key] = [payload[key]]
-                payload[key].append(temp[key])
-            else:
-                payload.update(temp)
-        return {self.name: payload}
\ No newline at end of file
+    def to_dict(self, policy: str = DuplicatePolicy.PROMOTE) -> dict:
+        return convert_block(self, policy)
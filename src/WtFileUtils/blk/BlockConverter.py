@@ -0,0 +1,92 @@
+class DuplicatePolicy:
+    """
+    what to do when a block has more than one param / child block with the same name when converting to a dict
+
+    PROMOTE: the first value is stored as is, the second turns it into a list (the original to_dict behaviour,
+    note that a list value like a FLOAT3 gets appended to rather than wrapped)
+    ALWAYS_LIST: every key maps to a list of its values, even when there is only one
+    LAST_WINS: every key maps to the last value with that name
+    PAIRS: blocks become ordered lists of (key, value) tuples, nothing is merged
+    """
+    PROMOTE = "promote"
+    ALWAYS_LIST = "always_list"
+    LAST_WINS = "last_wins"
+    PAIRS = "pairs"
+
+    policies = (PROMOTE, ALWAYS_LIST, LAST_WINS, PAIRS)
+
+
+def _add_promote(payload, key, value):
+    if key in payload:
+        current = payload[key]
+        if type(current) is not list:
+            payload[key] = [current, value]
+        else:
+            current.append(value)
+    else:
+        payload[key] = value
+
+
+def _add_always_list(payload, key, value):
+    if key in payload:
+        payload[key].append(value)
+    else:
+        payload[key] = [value]
+
+
+def _add_last_wins(payload, key, value):
+    payload[key] = value
+
+
+def _add_pair(payload, key, value):
+    payload.append((key, value))
+
+
+_adders = {
+    DuplicatePolicy.PROMOTE: _add_promote,
+    DuplicatePolicy.ALWAYS_LIST: _add_always_list,
+    DuplicatePolicy.LAST_WINS: _add_last_wins,
+    DuplicatePolicy.PAIRS: _add_pair,
+}
+
+
+def walk(block):
+    """
+    yields a block and every block under it, parents before children, in document order
+    uses an explicit stack so depth is not limited by the recursion limit
+    block: anything with .iter_children() (Block and LazyBlock)
+    """
+    stack = [block]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(node.iter_children())))
+
+
+def convert_block(block, policy: str = DuplicatePolicy.PROMOTE):
+    """
+    converts a block and everything under it to python data in time linear to the number of params and blocks
+    block: anything with .name, .iter_params() giving (name, value) pairs and .iter_children() (Block and LazyBlock)
+    returns {block.name: payload}, or [(block.name, payload)] for PAIRS
+
+    a childs payload is added to its parent before it is filled, so the tree is built with an explicit stack
+    instead of recursion and deep blks cant hit the recursion limit
+    """
+    add = _adders.get(policy)
+    if add is None:
+        raise ValueError(f"Unknown duplicate key policy {policy}, expected one of {DuplicatePolicy.policies}")
+    new_payload = list if policy == DuplicatePolicy.PAIRS else dict
+
+    out = new_payload()
+    root_payload = new_payload()
+    add(out, block.name, root_payload)
+    stack = [(block, root_payload)]
+    while stack:
+        node, payload = stack.pop()
+        for key, value in node.iter_params():
+            add(payload, key, value)
+        for child in node.iter_children():
+            child_payload = new_payload()
+            add(payload, child.name, child_payload)
+            stack.append((child, child_payload))
+    return out
@@ -0,0 +1,68 @@
+from ..DataHandler import DataCursor
+
+
+class BlockTable:
+    """
+    the block table of a blk stored as columns, index i of every list describes block i
+    inputs:
+    data: a DataCursor with its pointer at the start of the block table (right after the param table)
+    count: the number of blocks in the table
+
+    name_ids: the raw name id of the block, 0 is root, anything else is name_map index + 1
+    param_counts / block_counts: how many params and child blocks the block has
+    first_block_ids: index of the first child block, -1 when there are no children
+    first_param_ids: index into the param table of the blocks first param, params are stored in block order
+    """
+
+    def __init__(self, data: DataCursor, count: int):
+        self.count = count
+        self.name_ids = []
+        self.param_counts = []
+        self.block_counts = []
+        self.first_block_ids = []
+        self.first_param_ids = []
+        param_ptr = 0
+        read = data.decode_uleb128
+        for i in range(count):
+            name_id = read()
+            param_count = read()
+            block_count = read()
+            if block_count > 0:
+                first_block_id = read()
+            else:
+                first_block_id = -1
+            self.name_ids.append(name_id)
+            self.param_counts.append(param_count)
+            self.block_counts.append(block_count)
+            self.first_block_ids.append(first_block_id)
+            self.first_param_ids.append(param_ptr)
+            param_ptr += param_count
+
+    @classmethod
+    def from_columns(cls, name_ids: list[int], param_counts: list[int], block_counts: list[int],
+                     first_block_ids: list[int]) -> "BlockTable":
+        """
+        builds a table from already read columns (see BlkIndex.load) instead of from the blk
+        """
+        table = cls.__new__(cls)
+        table.count = len(name_ids)
+        table.name_ids = name_ids
+        table.param_counts = param_counts
+        table.block_counts = block_counts
+        table.first_block_ids = first_block_ids
+        table.first_param_ids = []
+        param_ptr = 0
+        for param_count in param_counts:
+            table.first_param_ids.append(param_ptr)
+            param_ptr += param_count
+        return table
+
+    def param_range(self, block_id: int) -> range:
+        start = self.first_param_ids[block_id]
+        return range(start, start + self.param_counts[block_id])
+
+    def child_range(self, block_id: int) -> range:
+        if self.block_counts[block_id] == 0:
+            return range(0)
+        start = self.first_block_ids[block_id]
+        return range(start, start + self.block_counts[block_id])
@@ -5,7 +5,7 @@ from WtFileUtils.blk.ParamParser import BLKTypes
 import dataclasses
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Chunk:
     name: str
     data_type_raw: int
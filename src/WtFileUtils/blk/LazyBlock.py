@@ -0,0 +1,74 @@
+from collections.abc import Mapping
+
+from ..blk.BlockConverter import DuplicatePolicy, convert_block, walk, _add_promote
+
+
+class LazyBlock(Mapping):
+    """
+    a read only, dict like view of a single block of a lazily decoded blk (BlkDecoder(..., lazy=True))
+    nothing about the block is decoded until it is first touched, then only its own params are decoded
+    and its children are created as (still undecoded) LazyBlocks
+
+    keys follow the same rules as Block.to_dict, params first then child blocks, a name that appears more than once
+    maps to a list of all its values
+    """
+
+    def __init__(self, decoder, block_id: int):
+        self._decoder = decoder
+        self.block_id = block_id
+        self._entries = None
+        self._children = None
+
+    @property
+    def name(self) -> str:
+        return self._decoder.block_id_to_name(self._decoder.block_table.name_ids[self.block_id])
+
+    def _load(self) -> dict:
+        if self._entries is not None:
+            return self._entries
+        decoder = self._decoder
+        table = decoder.block_table
+        self._children = [LazyBlock(decoder, child_id) for child_id in table.child_range(self.block_id)]
+        entries = {}
+        for key, value in self.iter_params():
+            # promoting appends to the first list value of a repeated name, so it gets its own copy
+            _add_promote(entries, key, list(value) if type(value) is list else value)
+        for child in self._children:
+            _add_promote(entries, child.name, child)
+        self._entries = entries
+        return entries
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return f"LazyBlock({self.name!r}, loaded={self._entries is not None})"
+
+    def iter_params(self):
+        """
+        (name, value) of every param of this block, decoded fresh on every call like Block.iter_params
+        """
+        table = self._decoder.block_table
+        return self._decoder.params.iter_params(table.first_param_ids[self.block_id], table.param_counts[self.block_id])
+
+    def walk(self):
+        """
+        every block from this one down, parents first, without recursion
+        """
+        return walk(self)
+
+    def iter_children(self):
+        self._load()
+        return iter(self._children)
+
+    def to_dict(self, policy: str = DuplicatePolicy.PROMOTE) -> dict:
+        """
+        fully decodes this block and everything below it, output matches Block.to_dict
+        """
+        return convert_block(self, policy)
@@ -1,5 +1,86 @@
+import functools
 import struct
+import sys
 
+import numpy as np
+
+
+class StringTable:
+    """
+    the strings stored in a blks param_data, looked up by offset
+    each offset is decoded the first time it is asked for and the same (interned) str is handed out after that, so
+    strings repeated across a blk (clan tags, unit names) are only decoded and kept in memory once
+    shared: optional SharedStrings shared by many blks (see BlkContext), strings already decoded by another blk are then
+    reused instead of decoded again
+    """
+
+    def __init__(self, param_data, shared: "SharedStrings" = None):
+        self.param_data = param_data
+        self._strings: dict[int, str] = {}
+        self._shared = shared
+
+    def get(self, offset: int) -> str:
+        string = self._strings.get(offset)
+        if string is None:
+            if self._shared is None:
+                string = sys.intern(BLKTypes.extractString(self.param_data, offset))
+            else:
+                end = self.param_data.find(b"\x00", offset)
+                string = self._shared.get(self.param_data[offset:end if end != -1 else len(self.param_data)])
+            self._strings[offset] = string
+        return string
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class SharedStrings:
+    """
+    a bounded table of decoded strings, shared by the blks of a batch through BlkContext
+    keyed by the hash of the raw bytes and checked against them on a hit, so the raw bytes are never kept next to the
+    str. once max_entries strings are stored new strings are still decoded, just not shared
+    """
+
+    def __init__(self, max_entries: int = 1 << 16):
+        self.max_entries = max_entries
+        self._strings: dict[int, str] = {}
+
+    def get(self, raw: bytes) -> str:
+        key = hash(raw)
+        string = self._strings.get(key)
+        if string is not None and string.encode("utf-8") == raw:
+            return string
+        string = sys.intern(raw.decode("utf-8"))
+        if len(self._strings) < self.max_entries and key not in self._strings:
+            self._strings[key] = string
+        return string
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class FlyweightTable:
+    """
+    a bounded table of decoded vector and COLOR values, so identical values decode to one shared tuple
+    shared by the blks of a batch through BlkContext, or made per blk with BlkDecoder(..., flyweight=True)
+    values are keyed by type id and raw bytes, so 0.0 and -0.0 (equal as floats) are never mixed up
+    once max_entries values are stored new values are still decoded, just not shared
+    """
+
+    def __init__(self, max_entries: int = 1 << 16):
+        self.max_entries = max_entries
+        self._values = {}
+
+    def get(self, key):
+        return self._values.get(key)
+
+    def add(self, key, value):
+        if len(self._values) < self.max_entries:
+            self._values[key] = value
+        return value
+
+    def __len__(self):
+        return len(self._values)
 
 
 class BLKTypes:
@@ -28,6 +109,16 @@ class BLKTypes:
     BOOL = 0x09
     COLOR = 0x0A
 
+    # types stored in param_data as a fixed number of values, type id -> (numpy dtype, values per param)
+    vector_layouts = {
+        0x04: ("<f4", 2),
+        0x05: ("<f4", 3),
+        0x06: ("<f4", 4),
+        0x0B: ("<f4", 12),
+        0x07: ("<i4", 2),
+        0x08: ("<i4", 3),
+    }
+
     types = {
         0x01: "STRING",
         0x02: "INT",
@@ -80,94 +171,199 @@ class BLKTypes:
         end = nullIndex
         return data[offset:end].decode('utf-8')
 
-    def __init__(self, name_map, param_data):
+    def __init__(self, name_map, param_data, shared_strings: SharedStrings = None, flyweights: FlyweightTable = None):
         self.name_map = name_map
         self.param_data = param_data
+        self.flyweights = flyweights
+        self._param_data_u8 = None  # numpy view of param_data, made on the first batch decode
+        self.strings = StringTable(param_data, shared_strings)
+        # type id -> function(payload as u32 int), built once instead of walking an if/elif chain per param
+        self._payload_decoders = {
+            self.STRING: self._string_from_payload,
+            self.INT: _int_from_payload,
+            self.FLOAT: _float_from_payload,
+            self.BOOL: _bool_from_payload,
+            self.COLOR: _color_from_payload,
+            self.LONG: self._offset_decoder(_long, scalar=True),
+            self.FLOAT2: self._offset_decoder(_float2),
+            self.FLOAT3: self._offset_decoder(_float3),
+            self.FLOAT4: self._offset_decoder(_float4),
+            self.FLOAT12: self._offset_decoder(_float12),
+            self.INT2: self._offset_decoder(_int2),
+            self.INT3: self._offset_decoder(_int3),
+        }
+        # type id -> function(numpy array of payloads) returning a list of values, see fromRawParamInfoBatch
+        self._batch_decoders = {
+            self.STRING: self._strings_from_payloads,
+            self.INT: lambda p: p.view("<i4").tolist(),
+            self.FLOAT: lambda p: p.view("<f4").tolist(),
+            self.BOOL: lambda p: ((p & 0xFF) != 0).tolist(),
+            self.COLOR: lambda p: p.astype("<u4").view(np.uint8).reshape(-1, 4).tolist(),
+            self.LONG: lambda p: self._gather(p, "<i8", 1),
+            self.FLOAT2: lambda p: self._gather(p, "<f4", 2),
+            self.FLOAT3: lambda p: self._gather(p, "<f4", 3),
+            self.FLOAT4: lambda p: self._gather(p, "<f4", 4),
+            self.FLOAT12: lambda p: self._gather(p, "<f4", 12),
+            self.INT2: lambda p: self._gather(p, "<i4", 2),
+            self.INT3: lambda p: self._gather(p, "<i4", 3),
+        }
+        if flyweights is not None:
+            # vectors and colors become shared tuples instead of new lists
+            self._payload_decoders[self.COLOR] = self._shared_color
+            self._batch_decoders[self.COLOR] = functools.partial(self._shared_batch, self._shared_color)
+            for type_id in self.vector_layouts:
+                decode = functools.partial(self._shared_vector, type_id)
+                self._payload_decoders[type_id] = decode
+                self._batch_decoders[type_id] = functools.partial(self._shared_batch, decode)
 
-    def fromRawParamInfo(self, typeId, data):
-        if typeId == self.STRING:
-            offset = self.bytesToUInt(data)
-            if offset is None:
-                return None
+    def _string_from_payload(self, payload):
+        in_name_map = (payload >> 31) == 1
+        actualOffset = payload & 0x7FFFFFFF
+        if in_name_map:
+            return self.name_map[actualOffset] if actualOffset < len(self.name_map) else None
+        return self.strings.get(actualOffset)
 
-            in_name_map = (offset >> 31) == 1
-            actualOffset = offset & 0x7FFFFFFF
+    def _strings_from_payloads(self, payloads) -> list:
+        # every distinct payload is only looked at once, repeats reuse the same str
+        unique, inverse = np.unique(payloads, return_inverse=True)
+        decoded = [self._string_from_payload(x) for x in unique.tolist()]
+        return [decoded[i] for i in inverse.ravel().tolist()]
 
-            if in_name_map:
-                return self.name_map[actualOffset] if actualOffset < len(self.name_map) else None
-            else:
-                return self.extractString(self.param_data, actualOffset)
-        elif typeId == self.INT:
-            return self.bytesToInt(data)
-        elif typeId == self.FLOAT:
-            return self.bytesToFloat(data)
-        elif typeId == self.FLOAT2:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 8 > len(self.param_data):
-                return None
-            return [
-                self.bytesToFloat(self.param_data[offset:offset + 4]),
-                self.bytesToFloat(self.param_data[offset + 4:offset + 8])
-            ]
-        elif typeId == self.FLOAT3:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 12 > len(self.param_data):
-                return None
-            return [
-                self.bytesToFloat(self.param_data[offset:offset + 4]),
-                self.bytesToFloat(self.param_data[offset + 4:offset + 8]),
-                self.bytesToFloat(self.param_data[offset + 8:offset + 12])
-            ]
-        elif typeId == self.FLOAT4:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 16 > len(self.param_data):
-                return None
-            return [
-                self.bytesToFloat(self.param_data[offset:offset + 4]),
-                self.bytesToFloat(self.param_data[offset + 4:offset + 8]),
-                self.bytesToFloat(self.param_data[offset + 8:offset + 12]),
-                self.bytesToFloat(self.param_data[offset + 12:offset + 16])
-            ]
-        elif typeId == self.INT2:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 8 > len(self.param_data):
-                return None
-            return [
-                self.bytesToInt(self.param_data[offset:offset + 4]),
-                self.bytesToInt(self.param_data[offset + 4:offset + 8])
-            ]
-        elif typeId == self.INT3:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 12 > len(self.param_data):
-                return None
-            return [
-                self.bytesToInt(self.param_data[offset:offset + 4]),
-                self.bytesToInt(self.param_data[offset + 4:offset + 8]),
-                self.bytesToInt(self.param_data[offset + 8:offset + 12])
-            ]
-        elif typeId == self.BOOL:
-            return data[0] != 0
-        elif typeId == self.COLOR:
-            return [
-                data[0],
-                data[1],
-                data[2],
-                data[3],
-            ]
-        elif typeId == self.FLOAT12:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 48 > len(self.param_data):
-                return None
-            result = []
-            for i in range(12):
-                start = offset + i * 4
-                end = start + 4
-                result.append(self.bytesToFloat(self.param_data[start:end]))
-            return result
-        elif typeId == self.LONG:
-            offset = self.bytesToOffset(data)
-            if offset is None or offset + 8 > len(self.param_data):
+    def _shared_vector(self, type_id: int, offset: int):
+        layout = _vector_structs[type_id]
+        end = offset + layout.size
+        if end > len(self.param_data):
+            return None
+        key = (type_id, self.param_data[offset:end])
+        value = self.flyweights.get(key)
+        if value is None:
+            value = self.flyweights.add(key, layout.unpack_from(self.param_data, offset))
+        return value
+
+    def _shared_color(self, payload: int):
+        key = (self.COLOR, payload)
+        value = self.flyweights.get(key)
+        if value is None:
+            value = self.flyweights.add(key, tuple(_uint.pack(payload)))
+        return value
+
+    @staticmethod
+    def _shared_batch(decode, payloads) -> list:
+        # like _strings_from_payloads, every distinct payload is decoded once
+        unique, inverse = np.unique(payloads, return_inverse=True)
+        decoded = [decode(x) for x in unique.tolist()]
+        return [decoded[i] for i in inverse.ravel().tolist()]
+
+    def _offset_decoder(self, layout: struct.Struct, scalar=False):
+        # values that live in param_data, the payload is the offset, out of bounds gives None like before
+        param_data = self.param_data
+        size = layout.size
+        unpack_from = layout.unpack_from
+
+        def decode(offset):
+            if offset + size > len(param_data):
                 return None
-            return self.bytesToLong(self.param_data[offset:offset + 8])
-        else:
+            if scalar:
+                return unpack_from(param_data, offset)[0]
+            return list(unpack_from(param_data, offset))
+        return decode
+
+    def _gather(self, offsets, dtype: str, count: int) -> list:
+        """
+        reads (count) values of (dtype) from param_data at every offset in one numpy gather
+        """
+        offsets = offsets.astype(np.int64)
+        valid = offsets + np.dtype(dtype).itemsize * count <= len(self.param_data)
+        rows = self.gather_array(offsets[valid], dtype, count)
+        decoded = rows.ravel().tolist() if count == 1 else rows.tolist()
+        if valid.all():
+            return decoded
+        out = [None] * len(offsets)
+        for i, value in zip(np.flatnonzero(valid).tolist(), decoded):
+            out[i] = value
+        return out
+
+    def gather_array(self, offsets, dtype: str, count: int) -> np.ndarray:
+        """
+        reads (count) values of (dtype) from param_data at every offset, returned as a (len(offsets), count) ndarray
+        offsets have to be in bounds
+        """
+        if self._param_data_u8 is None:
+            self._param_data_u8 = np.frombuffer(self.param_data, dtype=np.uint8)
+        size = np.dtype(dtype).itemsize * count
+        offsets = np.asarray(offsets, dtype=np.int64)
+        return self._param_data_u8[offsets[:, None] + np.arange(size)].view(dtype)
+
+    def fromPayload(self, typeId, payload: int):
+        """
+        same as fromRawParamInfo, but takes the 4 byte payload as an already unpacked u32
+        """
+        decoder = self._payload_decoders.get(typeId)
+        if decoder is None:
             return None
+        return decoder(payload)
+
+    def fromPayloads(self, type_ids: list[int], payloads: list[int]) -> list:
+        """
+        fromPayload for a short run of params, cheaper than fromRawParamInfoBatch when there are only a few
+        """
+        decoders = self._payload_decoders
+        return [decoders[type_id](payload) if type_id in decoders else None
+                for type_id, payload in zip(type_ids, payloads)]
+
+    def fromRawParamInfo(self, typeId, data):
+        if len(data) < 4:
+            return None
+        return self.fromPayload(typeId, _uint.unpack_from(data)[0])
+
+    def fromRawParamInfoBatch(self, type_ids, payloads) -> list:
+        """
+        decodes many params at once, params are grouped by type and every group is decoded in one pass
+        type_ids: numpy array of type ids
+        payloads: numpy array (u32) of the matching payloads
+        returns a list of values in the same order as the inputs, unknown types give None
+        """
+        values = [None] * len(type_ids)
+        for type_id in np.unique(type_ids).tolist():
+            decoder = self._batch_decoders.get(type_id)
+            if decoder is None:
+                continue
+            indexes = np.flatnonzero(type_ids == type_id)
+            for i, value in zip(indexes.tolist(), decoder(payloads[indexes])):
+                values[i] = value
+        return values
+
+
+_uint = struct.Struct("<I")
+_long = struct.Struct("<q")
+_float2 = struct.Struct("<2f")
+_float3 = struct.Struct("<3f")
+_float4 = struct.Struct("<4f")
+_float12 = struct.Struct("<12f")
+_int2 = struct.Struct("<2i")
+_int3 = struct.Struct("<3i")
+_float = struct.Struct("<f")
+_vector_structs = {
+    BLKTypes.FLOAT2: _float2,
+    BLKTypes.FLOAT3: _float3,
+    BLKTypes.FLOAT4: _float4,
+    BLKTypes.FLOAT12: _float12,
+    BLKTypes.INT2: _int2,
+    BLKTypes.INT3: _int3,
+}
+
+
+def _int_from_payload(payload):
+    return payload - 0x100000000 if payload & 0x80000000 else payload
+
+
+def _float_from_payload(payload):
+    return _float.unpack(_uint.pack(payload))[0]
+
+
+def _bool_from_payload(payload):
+    return (payload & 0xFF) != 0
+
+
+def _color_from_payload(payload):
+    return list(_uint.pack(payload))
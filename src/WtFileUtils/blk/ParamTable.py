@@ -0,0 +1,147 @@
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+from ..Exceptions import BlkParseException
+from ..blk.Chunk import Chunk
+from ..blk.ParamParser import BLKTypes
+
+_uint = struct.Struct("<I")
+BATCH_MIN = 32  # ranges shorter than this are decoded one value at a time, batching them costs more than it saves
+
+
+class ParamTable:
+    """
+    the param table of a blk read in one go instead of one 8 byte record at a time
+    each record is a 24 bit name id, a u8 type id and a u32 payload, these get split into three parallel columns
+    (name_ids, type_ids, payloads) which is all that is kept, values are only decoded when asked for
+    inputs:
+    raw: the num_of_params * 8 bytes of the param table
+    count: the number of params in the table
+    name_map: the decoded names of the blk
+    converter: the BLKTypes of the blk, used for every type that stores an offset into params_data
+    """
+    record = np.dtype({
+        "names": ["name_id", "type_id", "payload"],
+        "formats": ["<u4", "u1", "<u4"],
+        "offsets": [0, 3, 4],  # name_id overlaps type_id, the top byte gets masked off below
+        "itemsize": 8,
+    })
+
+    def __init__(self, raw, count: int, name_map: list[str], converter: BLKTypes):
+        self.count = count
+        self.name_map = name_map
+        self.converter = converter
+        records = np.frombuffer(raw, dtype=self.record, count=count)
+        self.name_ids = records["name_id"] & 0xFFFFFF
+        self.type_ids = np.ascontiguousarray(records["type_id"])
+        self.payloads = np.ascontiguousarray(records["payload"])
+        known = np.isin(self.type_ids, list(BLKTypes.types))
+        if not known.all():
+            # checked once here so a corrupt table fails like it used to instead of decoding to None
+            unknown = sorted(set(self.type_ids[~known].tolist()))
+            raise BlkParseException(f"unknown param type ids {unknown} in param table")
+
+    def names(self, start: int = 0, count: int = None) -> list[str]:
+        end = self.count if count is None else start + count
+        name_map = self.name_map
+        return [name_map[i] for i in self.name_ids[start:end].tolist()]
+
+    def value(self, type_id: int, payload: int):
+        """
+        decodes a single value from its type and payload
+        """
+        return self.converter.fromPayload(type_id, payload)
+
+    def values(self, start: int = 0, count: int = None) -> list:
+        """
+        decodes the values of params start to start + count (every param by default), grouped by type with one batched
+        pass per type, see BLKTypes
+        """
+        end = self.count if count is None else start + count
+        if end - start < BATCH_MIN:
+            return self.converter.fromPayloads(self.type_ids[start:end].tolist(), self.payloads[start:end].tolist())
+        return self.converter.fromRawParamInfoBatch(self.type_ids[start:end], self.payloads[start:end])
+
+    def iter_params(self, start: int, count: int):
+        """
+        yields (name, value) for params start to start + count, decoding each value as it is reached
+        """
+        end = start + count
+        name_map = self.name_map
+        value = self.value
+        for name_id, type_id, payload in zip(self.name_ids[start:end].tolist(), self.type_ids[start:end].tolist(),
+                                             self.payloads[start:end].tolist()):
+            yield name_map[name_id], value(type_id, payload)
+
+    def chunks(self, start: int, count: int) -> list[Chunk]:
+        """
+        builds Chunk objects for params start to start + count, nothing here is cached
+        """
+        end = start + count
+        name_map = self.name_map
+        type_names = BLKTypes.types
+        value = self.value
+        return [
+            Chunk(name_map[name_id], type_id, type_names[type_id], _uint.pack(payload), value(type_id, payload))
+            for name_id, type_id, payload in zip(self.name_ids[start:end].tolist(), self.type_ids[start:end].tolist(),
+                                                 self.payloads[start:end].tolist())
+        ]
+
+
+class ParamWindows:
+    """
+    the params of a ParamTable decoded (batched) a window of params at a time, with only the last few windows kept
+    for walks that visit every param once but not in table order (BlkEvents / BlkJson go depth first, the table is
+    breadth first), so memory stays the same whatever the size of the blk
+    inputs:
+    params: the ParamTable
+    size: how many params a window has
+    keep: how many decoded windows are kept
+    """
+
+    def __init__(self, params: ParamTable, size: int = 512, keep: int = 8):
+        self.params = params
+        self.size = size
+        self.keep = keep
+        self._windows: OrderedDict = OrderedDict()  # window index -> (name ids, type ids, values), oldest first
+        self._last = -1
+
+    def _window(self, index: int):
+        if index == self._last:  # the same window as the last lookup, skip the LRU bookkeeping
+            return self._windows[index]
+        self._last = index
+        window = self._windows.get(index)
+        if window is not None:
+            self._windows.move_to_end(index)
+            return window
+        params = self.params
+        start = index * self.size
+        end = min(start + self.size, params.count)
+        window = (params.name_ids[start:end].tolist(), params.type_ids[start:end].tolist(),
+                  params.values(start, end - start))
+        self._windows[index] = window
+        if len(self._windows) > self.keep:
+            self._windows.popitem(last=False)
+        return window
+
+    def get(self, start: int, count: int):
+        """
+        an iterator of (name id, type id, value) for params start to start + count
+        """
+        size = self.size
+        index, offset = divmod(start, size)
+        if offset + count <= size:  # nearly always, the params of a block are in one window
+            name_ids, type_ids, values = self._window(index)
+            end = offset + count
+            return zip(name_ids[offset:end], type_ids[offset:end], values[offset:end])
+        out = []
+        end = start + count
+        while start < end:
+            index, offset = divmod(start, size)
+            name_ids, type_ids, values = self._window(index)
+            stop = min(end - start, size - offset) + offset
+            out.extend(zip(name_ids[offset:stop], type_ids[offset:stop], values[offset:stop]))
+            start += stop - offset
+        return iter(out)
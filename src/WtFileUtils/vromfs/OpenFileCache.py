@@ -0,0 +1,136 @@
+import sys
+import threading
+from collections import OrderedDict
+
+'''
+an in memory cache of VROMFs.open_file results, shared by every VROMFs in the process
+it is off until enable() is called, after that open_file returns the cached result for files it opened before
+
+entries are kept under a byte budget, the size of an entry is estimated by walking the decoded data with
+sys.getsizeof, and the least recently used entries are dropped first
+
+the same objects are handed out on every hit, they should be treated as read only (copy.deepcopy them before editing)
+'''
+
+MISSING = object()
+
+
+def estimate_size(value) -> int:
+    """
+    roughly how many bytes value and everything in it take, objects used more than once are counted once
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        t = type(obj)
+        if t is dict:
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif t is list or t is tuple:
+            stack.extend(obj)
+    return total
+
+
+class OpenFileCache:
+    """
+    a byte budgeted LRU cache
+    inputs:
+    max_bytes: the budget, entries bigger than it are never stored
+
+    hits / misses / evictions: counters since the cache was made (or since clear)
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, estimated size), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        the value stored under key, MISSING when there is none
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            self._shrink()
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._shrink()
+
+    def _shrink(self) -> None:
+        # drops the least recently used entries until the cache is in budget, the lock has to be held
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "size": self.size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+_shared: OpenFileCache = None
+
+
+def enable(max_bytes: int = 256 << 20) -> OpenFileCache:
+    """
+    turns on the process wide cache (or changes its budget) and returns it
+    """
+    global _shared
+    if _shared is None:
+        _shared = OpenFileCache(max_bytes)
+    elif _shared.max_bytes != max_bytes:
+        _shared.resize(max_bytes)
+    return _shared
+
+
+def disable() -> None:
+    """
+    turns the process wide cache off and drops everything in it
+    """
+    global _shared
+    _shared = None
+
+
+def get_shared() -> OpenFileCache:
+    """
+    the process wide cache, None when it is off
+    """
+    return _shared
@@ -1,17 +1,20 @@
+import io
 import os
 import zstandard as zstd
 import _md5
 import traceback
-from itertools import batched
+from multiprocessing import Pool, shared_memory
 
 
-from ..DataHandler import DataHandler
+from .. import ZstdPool
+from ..vromfs import OpenFileCache
+from ..DataHandler import DataHandler, DataCursor
 from ..vromfs.FileInfoUtils import HeaderType, PlatformType, Packing, Version
 from ..Exceptions import VROMFSException
 from ..FileSystem.FSDirectory import FSDirectory
 from ..FileSystem.File import VROMFs_File
 from ..FileSystem.FileSystemQuery import FileSystemQuery
-from ..blk.BlkParser import BlkDecoder
+from ..blk.BlkParser import BlkDecoder, BlkContext, decode_name_map, blk_has_key, key_name_ids
 
 ZSTD_XOR_PATTERN = [0xAA55AA55, 0xF00FF00F, 0xAA55AA55, 0x12481248]
 ZSTD_XOR_PATTERN_REV = ZSTD_XOR_PATTERN[::-1]
@@ -23,19 +26,29 @@ class VROMFs:
     given a path to a vromfs file, will extract basic metadata of the file
     certain methods will fetch all the data from the vromfs file
     this includes
+    blk_cache: an optional BlkCache (see blk/BlkCache.py), open_file then only decodes blks it has not seen before
+    flyweight: decode blks with one flyweight table for the whole VROMFs (see BlkDecoder), repeated vector / COLOR
+    values in every file opened from it are then shared tuples
     """
 
-    def __init__(self, path):
+    def __init__(self, path, blk_cache=None, flyweight=False):
         if not os.path.exists(path):
             raise VROMFSException("Bad file path")
+        stat = os.stat(path)
+        # identifies this exact file in the shared OpenFileCache, a file that is replaced on disk gets new entries
+        self._cache_id = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
         self._raw: _RawData = None
         self.path = path
         self._header = None
         self._internal_parsed = False
         self._name_map = None
+        self._names = None  # _name_map decoded once, handed to every SLIM blk
         self._has_zstd_dict = False
         self._zstd_dict = None
+        self._context: BlkContext = None  # shared by every blk opened from this VROMFs
         self.version: VROMFs_File = None  # A VROMFs_File
+        self.blk_cache = blk_cache
+        self.flyweight = flyweight
 
     def get_directory(self, files=None, directory=None) -> FSDirectory:
         """
@@ -70,7 +83,7 @@ class VROMFs:
         """
         if self._raw is None:
             self._raw = _RawData(self.path)
-        data = DataHandler(self._raw.inner_data, 0, False)
+        data = DataCursor(self._raw.inner_data)
         has_digest = False  # currently not used, its truthiness is still calculated
         names_header = data.fetch(4)
         match (names_header[0]):
@@ -91,40 +104,34 @@ class VROMFs:
         if has_digest:
             pass  # not implemented
 
-        name_info_len = names_count * 8
-        name_info = self._raw.inner_data[names_offset:names_offset + name_info_len]
-        name_info_chunks = [name_info[x:x + 8] for x in range(0, len(name_info), 8)]
-        parsed_names_offsets = [int.from_bytes(x, byteorder="little") for x in name_info_chunks]
+        data.seek(names_offset)
+        parsed_names_offsets = [data.get_long() for _ in range(names_count)]
         names = [b"" for _ in range(names_count)]
         for index, offset in enumerate(parsed_names_offsets):
-            chars = []
-            while self._raw.inner_data[offset] != 0:
-                chars.append(self._raw.inner_data[offset])
-                offset += 1
-            names[index] = bytes(chars)
-
-        data_info_len = data_info_count * 4 * 4  # a len(u32) * 4
-        data_info = self._raw.inner_data[data_info_offset:data_info_offset + data_info_len]
-        data_info_split = [data_info[x:x + 4] for x in range(0, len(data_info), 4)]
-        data_info_split_quad = batched(data_info_split, 4)
+            data.seek(offset)
+            names[index] = data.readString()
+
+        data.seek(data_info_offset)
         countz = 0
         file_list = []
-        for b1, b2, *_ in data_info_split_quad:
-            offset, size = int.from_bytes(b1, byteorder="little"), int.from_bytes(b2, byteorder="little")
+        for _ in range(data_info_count):
+            offset, size = data.get_int(), data.get_int()
+            data.advance(8)  # the other two u32s of the entry are unused
             if names[countz] == b"\xff?nm":
                 names[countz] = b"nm"
                 raw = self._raw.inner_data[offset:offset + size]
                 _names_digest = raw[0:8]
                 _dict_digest = raw[8:40]
                 zstd_data = raw[40:]
-                raw_nm = DataHandler(zstd.decompress(zstd_data), 0, False)
+                raw_nm = DataCursor(ZstdPool.decompress(zstd_data))
                 names_count = raw_nm.decode_uleb128()
                 names_data_size = raw_nm.decode_uleb128()
 
-                names = raw_nm.fetch(names_data_size).split(b"\x00")[:-1]
-                if len(names) != names_count:
+                name_map = raw_nm.fetch(names_data_size).tobytes().split(b"\x00")[:-1]
+                if len(name_map) != names_count:
                     raise VROMFSException("Bad Name Map")
-                self._name_map = names
+                self._name_map = name_map
+                self._names = decode_name_map(name_map)
             elif names[countz].endswith(b"dict"):
                 self._has_zstd_dict = True
                 self._zstd_dict = zstd.ZstdCompressionDict(self._raw.inner_data[offset:offset + size])
@@ -135,12 +142,15 @@ class VROMFs:
             elif generate_files:  # this code body handles all file creation as it only includes important files
                 file_list.append(VROMFs_File(names[countz].decode("utf-8").split("/"), offset, size, self))
             countz += 1
+        self._context = BlkContext(self._names, self._zstd_dict, self.flyweight)
         self._internal_parsed = True
         if generate_files:
             return file_list
 
     '''
     given a VROMFs_File object, will look up that object in the VROMFs and return the unpacked data
+    when the shared OpenFileCache is enabled (see vromfs/OpenFileCache.py) files opened before come from it, the data is
+    then shared between calls and should not be edited
     '''
 
     def open_file(self, file: VROMFs_File):
@@ -149,13 +159,22 @@ class VROMFs:
         if not self._internal_parsed:
             self._get_file_data(generate_files=False)
         else:
+            cache = OpenFileCache.get_shared()
+            if cache is not None:
+                key = (self._cache_id, file.offset, file.size, self.flyweight)
+                data = cache.get(key)
+                if data is not OpenFileCache.MISSING:
+                    return data
             raw = self._raw.inner_data[file.offset:file.offset + file.size]
             file_type = file.file_name.split(".")[-1]
             data = None
             match file_type:
                 case "blk":
                     try:
-                        data = BlkDecoder(raw, name_map=self._name_map, zstd_dict=self._zstd_dict).to_dict()
+                        if self.blk_cache is not None:
+                            data = self.blk_cache.decode(raw, context=self._context)
+                        else:
+                            data = BlkDecoder(raw, context=self._context).to_dict()
                     except Exception:
                         stack_trace = traceback.format_exc()
                         print(f"blk read error on {file.file_name}, name_map: {self._name_map is not None}, zstd_dict: {self._zstd_dict is not None}")
@@ -163,13 +182,102 @@ class VROMFs:
                         data = self.open_file_raw(file)
 
                 case _:
-                    data = raw
+                    data = bytes(raw)
 
+            if cache is not None:
+                cache.put(key, data)
             return data
 
+    '''
+    same as open_file, but writes the file to a binary stream. blks are written as json straight from the decoder
+    instead of going through to_dict and json.dumps
+    '''
+
+    def write_file(self, file: VROMFs_File, stream):
+        if file.VROMFs != self:
+            raise VROMFSException("VROMFs called to open file not same as object that generate the File")
+        if not self._internal_parsed:
+            self._get_file_data(generate_files=False)
+        raw = self._raw.inner_data[file.offset:file.offset + file.size]
+        if file.file_name.split(".")[-1] != "blk":
+            stream.write(raw)
+            return
+        try:
+            data = _blk_to_json(raw, self._context)
+        except Exception:
+            stack_trace = traceback.format_exc()
+            print(f"blk read error on {file.file_name}, name_map: {self._name_map is not None}, zstd_dict: {self._zstd_dict is not None}")
+            print(stack_trace)
+            data = raw
+        stream.write(data)
+
+    def files_with_key(self, key: str, files: list[VROMFs_File] = None) -> list[VROMFs_File]:
+        """
+        returns the blk files that have a param or block called key, found without decoding them (see blk_has_key)
+        files: the files to check, defaults to every file in the VROMFs. files that are not blks are skipped
+        """
+        if files is None:
+            files = self._get_file_data()
+        elif not self._internal_parsed:
+            self._get_file_data(generate_files=False)
+        # looked up in the shared name map once, every SLIM blk then only checks its name id columns
+        name_ids = key_name_ids(key, self._names) if self._names is not None else None
+        found = []
+        for file in files:
+            if file.file_name.split(".")[-1] != "blk":
+                continue
+            raw = self._raw.inner_data[file.offset:file.offset + file.size]
+            try:
+                if blk_has_key(raw, key, name_map=self._names, zstd_dict=self._zstd_dict, name_ids=name_ids):
+                    found.append(file)
+            except Exception:
+                print(f"blk read error on {file.file_name} while looking for {key}")
+        return found
+
+    def decode_all(self, workers: int = None, files: list[VROMFs_File] = None, dump_path: str = None,
+                   chunk_size: int = 32):
+        """
+        decodes every blk in the VROMFs with a pool of worker processes
+        the inner data is copied into a multiprocessing.shared_memory block once, each worker attaches to it and decodes
+        its files from (offset, size) ranges, so no file data is pickled to the workers
+        workers: number of processes, defaults to os.cpu_count(), 1 decodes in this process
+        files: the files to decode, defaults to every file in the VROMFs
+        dump_path: when given every file (blks as json, anything else as is) is written under this directory by the
+        workers and nothing is returned, this avoids sending the decoded blks back
+        chunk_size: how many files are handed to a worker at a time
+        returns {"path/to/file.blk": decoded dict} for every blk when dump_path is None
+        """
+        if files is None:
+            files = self._get_file_data()
+        elif not self._internal_parsed:
+            self._get_file_data(generate_files=False)
+        tasks = [("/".join(f.true_name), f.offset, f.size) for f in files
+                 if dump_path is not None or f.file_name.split(".")[-1] == "blk"]
+        zstd_dict = self._zstd_dict.as_bytes() if self._zstd_dict is not None else None
+        chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+        out = {}
+        if workers == 1 or not tasks:
+            _worker_init(None, self._name_map, zstd_dict, self._raw.inner_data)
+            for chunk in chunks:
+                out.update(_worker_decode(chunk, dump_path))
+            _worker_state.clear()
+            return None if dump_path is not None else out
+
+        inner_data = self._raw.inner_data
+        shm = shared_memory.SharedMemory(create=True, size=len(inner_data))
+        try:
+            shm.buf[:len(inner_data)] = inner_data
+            with Pool(workers, initializer=_worker_init, initargs=(shm.name, self._name_map, zstd_dict)) as pool:
+                for result in pool.imap_unordered(_decode_chunk, [(chunk, dump_path) for chunk in chunks]):
+                    out.update(result)
+        finally:
+            shm.close()
+            shm.unlink()
+        return None if dump_path is not None else out
+
     def open_file_raw(self, file: VROMFs_File):
         if self._internal_parsed:
-            return self._raw.inner_data[file.offset:file.offset + file.size]
+            return bytes(self._raw.inner_data[file.offset:file.offset + file.size])
         else:
             self._get_file_data(generate_files=False)
 
@@ -177,6 +285,66 @@ class VROMFs:
         pass
 
 
+def _blk_to_json(raw, context: BlkContext) -> bytes:
+    """
+    the json of a blk, decoded lazily into a buffer so a blk that fails part way through (values are only decoded while
+    the json is written) raises before anything reaches the real stream
+    """
+    buffer = io.BytesIO()
+    BlkDecoder(raw, lazy=True, context=context).to_json(buffer)
+    return buffer.getvalue()
+
+
+_worker_state = {}  # the shared memory, its data and the BlkContext of a decode_all worker
+
+
+def _worker_init(shm_name, name_map, zstd_dict_data, data=None):
+    """
+    sets up a decode_all worker, attaching to the shared inner data (or using data when decoding in process)
+    """
+    if data is None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_state["shm"] = shm
+        data = shm.buf
+    zstd_dict = zstd.ZstdCompressionDict(zstd_dict_data) if zstd_dict_data is not None else None
+    _worker_state["data"] = data
+    _worker_state["context"] = BlkContext(name_map, zstd_dict)
+
+
+def _decode_chunk(args):
+    return _worker_decode(*args)
+
+
+def _worker_decode(tasks, dump_path):
+    """
+    decodes (path, offset, size) entries from the workers data, see VROMFs.decode_all
+    """
+    data = _worker_state["data"]
+    context = _worker_state["context"]
+    out = {}
+    for path, offset, size in tasks:
+        raw = bytes(data[offset:offset + size])  # copied out so nothing holds on to the shared memory
+        output = raw
+        if path.split(".")[-1] == "blk":
+            try:
+                if dump_path is None:
+                    out[path] = BlkDecoder(raw, context=context).to_dict()
+                    continue
+                output = _blk_to_json(raw, context)
+            except Exception:
+                stack_trace = traceback.format_exc()
+                print(f"blk read error on {path}")
+                print(stack_trace)
+                if dump_path is None:
+                    out[path] = raw
+                    continue
+        target = os.path.join(dump_path, *path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(output)
+    return out
+
+
 class _RawData:
     size_mask = 0b0000001111111111111111111111111
     """
@@ -187,7 +355,7 @@ class _RawData:
     def __init__(self, path):
         self.metaData = None
         with open(path, 'rb') as f:
-            raw = DataHandler(bytearray(f.read()), 0, False)
+            raw = DataHandler(f, 0, True)  # memory mapped, plain images are used straight from the mapping
         self.inner_data = self._get_inner(raw)
 
     '''
@@ -205,7 +373,7 @@ class _RawData:
         inner_data = None
         if header_type == "VRFX":
             raw.advance(4)
-            version = Version(raw.fetch(4))
+            version = Version(bytes(raw.fetch(4)))
             if pack_size == 0:
                 inner_data = raw.get_rest()
             else:
@@ -219,7 +387,7 @@ class _RawData:
         if not packing.has_zstd_obfs():
             return inner_data
 
-        output = zstd.decompress(self.deobfuscate(inner_data))  # every zstd packed type is also obfuscated
+        output = ZstdPool.decompress(self.deobfuscate(inner_data))  # every zstd packed type is also obfuscated
 
         if packing.has_digest():  # checking for hash
             h = raw.fetch(16)